@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Chat dispatch throughput, indexed vs. the old linear scan over every command.
+
+    python bench/dispatch.py [commands] [messages]
+"""
+# pylint: disable=missing-docstring,too-few-public-methods
+
+import logging
+import os
+import sys
+import tempfile
+
+from time import perf_counter
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(tempfile.mkdtemp(prefix="parrotbench"))
+
+# pylint: disable=wrong-import-position
+from volaparrot.commands import Command
+from volaparrot.handler import Handler, Registry
+
+
+class Room:
+    name = "bench"
+    user = SimpleNamespace(name="Parrot")
+
+
+class LinearHandler(Handler):
+    def candidates(self, cmd):
+        return enumerate(self.commands)
+
+
+def make_commands(num):
+    commands = list()
+    for i in range(num):
+        commands += type("Bench{:04}Command".format(i), (Command,), dict(
+            handlers=("!bench{}".format(i), ".bench{}".format(i)),
+            handle_cmd=lambda self, cmd, rem, msg: True)),
+    # A handful of catch-alls, like the web and seen commands
+    for i in range(6):
+        commands += type("BenchCatchall{}Command".format(i), (Command,), dict(
+            handles=lambda self, cmd: bool(cmd),
+            handle_cmd=lambda self, cmd, rem, msg: False)),
+    commands += type("BenchChenCommand", (Command,), dict(
+        pattern=r"\!che+n$",
+        handle_cmd=lambda self, cmd, rem, msg: True)),
+    return commands
+
+
+def make_messages(num, commands):
+    lines = ["!bench{} some text".format(i % commands) for i in range(0, num, 2)]
+    lines += ["just some chat line about nothing"] * (num // 4)
+    lines += ["!cheeeen"] * (num - len(lines))
+    return [SimpleNamespace(nick="benchuser", msg=line, logged_in=True,
+                            admin=False, staff=False, rooms={}, files=[])
+            for line in lines]
+
+
+def run(handler, messages):
+    start = perf_counter()
+    for msg in messages:
+        handler.chat(msg)
+    return len(messages) / (perf_counter() - start)
+
+
+def main():
+    numcommands = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    nummessages = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    logging.basicConfig(level=logging.WARNING)
+
+    args = SimpleNamespace(
+        blacks=[], obamas=[], admins=[], muterooms=[], noparrot=False,
+        post_rate=2.0, post_window=0.25)
+    room = Room()
+    commands = make_commands(numcommands)
+    messages = make_messages(nummessages, numcommands)
+
+    registry = Registry(commands, args)
+    linear = run(LinearHandler(registry, room, args), messages)
+    indexed = run(Handler(registry, room, args), messages)
+    print("{} commands, {} messages".format(len(commands), len(messages)))
+    print("linear:  {:>12,.0f} msg/s".format(linear))
+    print("indexed: {:>12,.0f} msg/s ({:.1f}x)".format(indexed, indexed / linear))
+
+
+if __name__ == "__main__":
+    main()
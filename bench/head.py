@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Unfurling the meta tags of a large page from a local HTTP stand-in:
+downloading the whole document and searching it with regexes (the old way)
+vs. streaming it into the head parser, which stops once it has the tags.
+
+    python bench/head.py [rounds]
+"""
+# pylint: disable=missing-docstring
+
+import os
+import re
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from volaparrot.htmlhead import HeadFetcher
+from volaparrot.utils import requests
+
+HEAD = (
+    '<!DOCTYPE html><html><head><meta charset="utf-8">'
+    '<title>Some video</title>'
+    + '<script>var filler = "{}";</script>'.format("x" * 2000) * 10 +
+    '<meta property="og:title" content="Some &amp; video">'
+    '<meta property="og:description" content="Watch it">'
+    '<meta property="og:image" content="http://example.com/1.jpg">'
+    '<meta property="og:image" content="http://example.com/2.jpg">'
+    '<link rel="stylesheet" href="x.css"></head>').encode("utf-8")
+BODY = b"<body>" + b"<div class='comment'>blah blah blah</div>" * 50000 + b"</body></html>"
+PAGE = HEAD + BODY
+
+TITLE = re.compile(r'property="og:title"\s+content="(.+?)"', re.M | re.S)
+DESC = re.compile(r'property="og:description"\s+content="(.+?)"', re.M | re.S)
+
+
+class Page(BaseHTTPRequestHandler):
+    def do_GET(self):
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def full(url):
+    text = requests.get(url).text
+    return TITLE.search(text).group(1), DESC.search(text).group(1)
+
+
+def streamed(fetcher, url):
+    head = fetcher.fetch(url, "og:title", "og:description", "og:image")
+    return head.first("og:title"), head.first("og:description")
+
+
+def run(name, func, urls):
+    start = perf_counter()
+    for url in urls:
+        func(url)
+    elapsed = perf_counter() - start
+    print("{:10} {:8.2f}ms/page".format(name, elapsed * 1000 / len(urls)))
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Page)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = ["http://127.0.0.1:{}/{}".format(server.server_address[1], i)
+            for i in range(rounds)]
+    print("page: {} bytes, head: {} bytes".format(len(PAGE), len(HEAD)))
+    fetcher = HeadFetcher(requests)
+    print("full:    ", full(urls[0]))
+    print("streamed:", streamed(fetcher, urls[0]))
+    run("full", full, urls)
+    run("streamed", lambda u: streamed(fetcher, u), urls)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
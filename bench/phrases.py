@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Cost of the phrase lookup every "!something" chat line goes through:
+one SELECT per message vs. the in-memory phrase map.
+
+    python bench/phrases.py [phrases] [lookups]
+"""
+# pylint: disable=missing-docstring
+
+import os
+import random
+import sys
+import tempfile
+
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(tempfile.mkdtemp(prefix="parrotbench"))
+
+# pylint: disable=wrong-import-position
+from volaparrot.commands.phrase import PhraseCommand
+
+
+class QueryPhraseCommand(PhraseCommand):
+    """The old lookup, a query per message"""
+
+    def get_phrase(self, phrase):
+        phrase = phrase.casefold()
+        if not phrase:
+            return None
+        cur = self.conn.cursor()
+        phrase = cur.execute("SELECT phrase, text, locked, owner FROM phrases "
+                             "WHERE phrase = ?",
+                             (phrase,)).fetchone()
+        return self.to_phrase(phrase) if phrase else phrase
+
+
+def run(command, lookups):
+    start = perf_counter()
+    hits = 0
+    for phrase in lookups:
+        if command.get_phrase(phrase):
+            hits += 1
+    return perf_counter() - start, hits
+
+
+def main():
+    numphrases = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    numlookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    PhraseCommand.db.executemany(
+        "INSERT OR REPLACE INTO phrases VALUES(?, ?, ?, ?)",
+        (("phrase{}".format(i), "text {}".format(i), 0, "bench")
+         for i in range(numphrases))).result()
+    # Most "!" lines are commands handled elsewhere or typos, i.e. misses
+    lookups = [
+        "phrase{}".format(random.randrange(numphrases)) if random.random() < 0.3
+        else "nophrase{}".format(random.randrange(numphrases))
+        for _ in range(numlookups)]
+
+    print("{} phrases, {} lookups".format(numphrases, numlookups))
+    for name, command in (("query", QueryPhraseCommand()), ("map", PhraseCommand())):
+        command.get_phrase("warmup")
+        elapsed, hits = run(command, lookups)
+        print("{:<6} {:>8.1f} ms {:>10,.0f} lookups/s ({} hits)".format(
+            name, elapsed * 1000, numlookups / elapsed, hits))
+
+
+if __name__ == "__main__":
+    main()
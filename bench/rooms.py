@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Cost of joining many rooms: a command set per room vs. one shared command
+set plus a lightweight RoomContext per room.
+
+    python bench/rooms.py [rooms]
+"""
+# pylint: disable=missing-docstring,too-few-public-methods
+
+import gc
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from time import perf_counter
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(tempfile.mkdtemp(prefix="parrotbench"))
+
+# pylint: disable=wrong-import-position
+from volaparrot.handler import Commands, Handler, Registry
+
+
+class Room:
+    user = SimpleNamespace(name="Parrot")
+
+    def __init__(self, num):
+        self.name = self.room_id = "room{}".format(num)
+
+
+def per_room(commands, rooms, args):
+    return [Handler(Registry(commands, args), room, args) for room in rooms]
+
+
+def shared(commands, rooms, args):
+    registry = Registry(commands, args)
+    return [Handler(registry, room, args) for room in rooms]
+
+
+def measure(func, commands, rooms, args):
+    gc.collect()
+    tracemalloc.start()
+    start = perf_counter()
+    handlers = func(commands, rooms, args)
+    elapsed = perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del handlers
+    return elapsed, memory
+
+
+def main():
+    numrooms = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    logging.basicConfig(level=logging.CRITICAL)
+
+    args = SimpleNamespace(
+        blacks=[], obamas=[], admins=[], muterooms=[], noparrot=False,
+        post_rate=2.0, post_window=0.25,
+        ignoredrooms=[], blackrooms=[], whiterooms=[])
+    commands = Commands([])
+    rooms = [Room(i) for i in range(numrooms)]
+
+    print("{} command classes, {} rooms".format(len(commands), numrooms))
+    for name, func in (("per room", per_room), ("shared", shared)):
+        elapsed, memory = measure(func, commands, rooms, args)
+        print("{:<9} {:>8.1f} ms {:>10,.0f} KiB".format(
+            name, elapsed * 1000, memory / 1024))
+
+
+if __name__ == "__main__":
+    main()
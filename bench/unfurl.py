@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Unfurl latency against a local HTTP stand-in with fast, slow and hanging
+pages: fetching the links of each message one after another on one thread
+(the old way, without and with the default timeouts of the session) vs. the
+concurrent unfurl pipeline (with the same timeouts).
+Hanging pages outlast the read timeout.
+Latency is from a message arriving to all of its links being unfurled.
+
+    python bench/unfurl.py [messages]
+"""
+# pylint: disable=missing-docstring
+
+import asyncio
+import os
+import random
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from volaparrot.unfurl import Unfurler
+from volaparrot.utils import requests
+
+DELAYS = {"fast": 0.02, "slow": 0.5, "hang": 12.0}
+INTERVAL = 0.05
+LINKS = 2
+
+
+class Page(BaseHTTPRequestHandler):
+    def do_GET(self):
+        kind = self.path.split("/")[1].split("?")[0]
+        try:
+            sleep(DELAYS[kind])
+            body = b"<title>" + kind.encode("utf-8") + b"</title>"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def make_messages(port, num):
+    rand = random.Random(42)
+    messages = list()
+    for i in range(num):
+        links = list()
+        for j in range(LINKS):
+            kind = rand.choices(("fast", "slow", "hang"), (75, 20, 5))[0]
+            # Every host of its own, like different sites
+            host = "127.0.0.{}".format(rand.randint(1, 8))
+            links += "http://{}:{}/{}?{}-{}".format(host, port, kind, i, j),
+        messages += links,
+    return messages
+
+
+def fetch(url, timeout):
+    try:
+        return requests.get(url, timeout=timeout).text
+    except Exception:
+        return None
+
+
+def sequential(messages, timeout=None):
+    """One listener thread, each link in turn"""
+    latencies = list()
+    start = perf_counter()
+    for num, links in enumerate(messages):
+        arrived = start + num * INTERVAL
+        while perf_counter() < arrived:
+            sleep(0.001)
+        for url in links:
+            fetch(url, timeout)
+        latencies += perf_counter() - arrived,
+    return latencies
+
+
+def pipelined(messages):
+    unfurler = Unfurler()
+    latencies = list()
+
+    async def handle(links, arrived):
+        async for _ in unfurler.ordered(
+                (url, fetch, (requests.timeout,), None, None) for url in links):
+            pass
+        latencies.append(perf_counter() - arrived)
+
+    async def run():
+        start = perf_counter()
+        tasks = list()
+        for num, links in enumerate(messages):
+            arrived = start + num * INTERVAL
+            await asyncio.sleep(max(0, arrived - perf_counter()))
+            tasks += asyncio.ensure_future(handle(links, arrived)),
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    unfurler.executor.shutdown()
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+
+    def pct(num):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * num / 100))] * 1000
+
+    print("{:<10} p50 {:>8.0f} ms  p90 {:>8.0f} ms  p99 {:>8.0f} ms  max {:>8.0f} ms".format(
+        name, pct(50), pct(90), pct(99), latencies[-1] * 1000))
+
+
+def main():
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    server = ThreadingHTTPServer(("0.0.0.0", 0), Page)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    messages = make_messages(server.server_address[1], num)
+
+    print("{} messages, {} links each, one every {:.0f} ms, timeouts {}".format(
+        num, LINKS, INTERVAL * 1000, requests.timeout))
+    report("sequential", sequential(messages))
+    report("timeouts", sequential(messages, requests.timeout))
+    report("pipelined", pipelined(messages))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
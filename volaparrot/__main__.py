@@ -41,7 +41,8 @@ from volapi import Room, listen_many
 from .constants import ADMINFAG, PARROTFAG
 from ._version import __fulltitle__, __version__
 from .arb import ARBITRATOR
-from .handler import Handler, Commands
+from .handler import Handler, Commands, Registry
+from .workers import Lanes
 from .commands import BaseCommand, Command
 
 
@@ -149,9 +150,28 @@ def parse_args():
     parser.add_argument("--muterooms", default=config("muterooms", split=" "),
                         type=str, nargs="*",
                         help="Rooms to lurk bot not spam")
+    parser.add_argument("--workers", default=config("workers", 0, reqtype=int),
+                        type=int,
+                        help="Number of threads running command handlers "
+                             "(default 0 = inline, one event at a time)")
+    parser.add_argument("--queue-depth", dest="queue_depth",
+                        default=config("queue_depth", 100, reqtype=int),
+                        type=int,
+                        help="Maximum number of pending events per room")
+    parser.add_argument("--post-rate", dest="post_rate",
+                        default=config("post_rate", 2.0, reqtype=float),
+                        type=float,
+                        help="Maximum number of messages posted per second and room")
+    parser.add_argument("--post-window", dest="post_window",
+                        default=config("post_window", 0.25, reqtype=float),
+                        type=float,
+                        help="Seconds to wait for more posts to merge into one message")
     parser.add_argument("--commands", default=config("commands", split=" "),
                         type=str, nargs="*",
                         help="More commands to use")
+    parser.add_argument("--import", dest="importing", action="store_true",
+                        help="Bulk import phrases instead of running, has to "
+                             "come first (see --import --help)")
     parser.add_argument("rooms", default=config("rooms", split=" "),
                         type=str, nargs="*",
                         help="Rooms to fuck up")
@@ -164,6 +184,8 @@ def parse_args():
         }
     parser.set_defaults(**{k: config(k, v, reqtype=bool) for k, v in defaults.items()})
     result = parser.parse_args()
+    if result.importing:
+        parser.error("--import has to come first")
     if not result.rooms:
         parser.error("Provide rooms, you cuck!")
     result.blacks = [i.casefold() for i in result.blacks]
@@ -171,7 +193,7 @@ def parse_args():
     return result
 
 
-def setup_room(room, commands, args):
+def setup_room(room, registry, args):
     # login
     if args.passwd and not room.user.logged_in:
         try:
@@ -182,7 +204,7 @@ def setup_room(room, commands, args):
             if not args.softlogin:
                 return 1
             args.passwd = None
-    handler = Handler(commands, room, args)
+    handler = Handler(registry, room, args)
 
     # XXX Handle elsewhere
     if args.feedrooms:
@@ -208,13 +230,12 @@ def setup_room(room, commands, args):
     # Wire up listeners
     if handler.commands:
         room.add_listener("chat", handler.chat)
-    if handler.file_commands:
-        room.add_listener("file", handler.file)
+    # Always needed, post_fid waits on file events
+    room.add_listener("file", handler.file)
     if handler.pulse_commands:
-        mininterval = min(h.interval for h in handler.pulse_commands)
         room.add_listener("pulse", handler.pulse)
-        ARBITRATOR.start_pulse(room, mininterval)
-        logger.debug("installed pulse with interval %f", mininterval)
+        ARBITRATOR.start_pulse(room, handler.pulse_commands)
+        logger.debug("installed pulse for %d commands", len(handler.pulse_commands))
     room.add_listener("call", handler.call)
 
 
@@ -271,9 +292,10 @@ def main():
     BaseCommand.set_global_active(not args.ded)
     BaseCommand.shitposting = args.shitposting
     Command.greens = args.greenmasterrace
+    Handler.lanes = Lanes(args.workers, args.queue_depth)
 
     try:
-        commands = Commands(args.commands)
+        registry = Registry(Commands(args.commands), args)
         with ExitStack() as stack:
             rooms = list()
             room0 = None
@@ -282,7 +304,9 @@ def main():
                     room = stack.enter_context(Room(room, args.parrot, other=room0))
                     if not room0:
                         room0 = room
-                    setup_room(room, commands, args)
+                    # Runs before the room closes, so the ticker lets go of it
+                    stack.callback(ARBITRATOR.stop_pulse, room)
+                    setup_room(room, registry, args)
                     rooms += room,
                     time.sleep(0.5)
                 except:
@@ -334,6 +358,11 @@ def debug_handler(_, frame):
 
 
 def run():
+    # A flag, as any word could be a room
+    if len(sys.argv) > 1 and sys.argv[1] == "--import":
+        from .importer import main as import_main
+        sys.exit(import_main(sys.argv[2:]))
+
     try:
         import signal
         signal.signal(signal.SIGUSR2, debug_handler)
@@ -28,9 +28,11 @@ from types import MethodType
 
 import volapi.volapi as volapi_internal
 
-from volapi.arbritrator import call_async, call_sync, ARBITRATOR
+from volapi.arbritrator import call_sync, ARBITRATOR
 
 from .processor import Processor
+from .scheduler import PulseScheduler
+from .timers import Timer, Timers
 
 
 __all__ = ["ARBITRATOR"]
@@ -39,36 +41,80 @@ LOGGER = logging.getLogger(__name__)
 
 
 @call_sync
-def pulse(self, room, interval=0.2):
+def pulse(self, room, commands):
     LOGGER.debug("pulse for %s is a go!", repr(room))
+    self.pulses.add(room, commands, self.loop.time())
+    _arm_ticker(self)
 
-    @asyncio.coroutine
-    def looper():
-        LOGGER.debug("looping %s %s", repr(room), repr(interval))
-        while True:
-            nextsleep = asyncio.sleep(interval)
+@call_sync
+def unpulse(self, room):
+    LOGGER.debug("pulse for %s is a no-go!", repr(room))
+    self.pulses.remove(room)
+    if not self.pulses and self.ticker:
+        self.ticker.cancel()
+        self.ticker = None
+
+def _arm_ticker(self):
+    """(Re)arm the one ticker for all rooms for the earliest deadline"""
+    if not self.pulses:
+        return
+    when = self.pulses.next_due
+    if self.ticker:
+        if self.ticker.when() <= when:
+            return
+        self.ticker.cancel()
+    self.ticker = self.loop.call_at(when, _tick, self)
+
+def _tick(self):
+    self.ticker = None
+    try:
+        current = time()
+        for room, due in self.pulses.pop_due(self.loop.time()):
+            # Deadlines moved on already, so just skip rooms that are gone
+            if not room.connected:
+                continue
             try:
-                if room.connected:
-                    room.conn.enqueue_data("pulse", time())
-                    room.conn.process_queues()
-                yield from nextsleep
+                room.conn.enqueue_data("pulse", (current, due))
+                room.conn.process_queues()
             except Exception:
-                LOGGER.exception("Failed to enqueue pulse")
-
-    asyncio.async(looper(), loop=self.loop)
+                LOGGER.exception("Failed to enqueue pulse for %r", room)
+    finally:
+        _arm_ticker(self)
 
-@call_async
-def _call_later(self, room, delay, callback, *args, **kw):
+def _schedule(self, room, delay, callback, args, kw, key=None):
+    # pylint: disable=too-many-arguments
     if not callback:
-        return
+        return None
+    timer = Timer(self.timers, room, delay, callback, args, kw, key)
+    registered = self.timers.add(timer)
+    if registered is not timer:
+        # Over the limit, or already scheduled under that key
+        return registered
 
     def insert():
+        if not timer.pending:
+            return
+        timer.fired = True
+        self.timers.done(timer)
         if room.connected and room.conn:
             room.conn.enqueue_data("call", [callback, args, kw])
             room.conn.process_queues()
 
+    def arm():
+        if timer.pending:
+            timer.handle = self.loop.call_at(
+                self.loop.time() + timer.remaining, insert)
+
     LOGGER.debug("call later scheduled %r %r %r", room, delay, callback)
-    self.loop.call_later(delay, insert)
+    self.loop.call_soon_threadsafe(arm)
+    return timer
+
+def _call_later(self, room, delay, callback, *args, **kw):
+    return self.schedule(room, delay, callback, args, kw)
+
+def _call_later_keyed(self, room, key, delay, callback, *args, **kw):
+    # pylint: disable=too-many-arguments
+    return self.schedule(room, delay, callback, args, kw, key)
 
 def _run_process(self, room, callback, *args):
     if not hasattr(self, "processor"):
@@ -80,10 +126,20 @@ def _run_process(self, room, callback, *args):
 
     self.processor(result, args)
 
+def _run_coroutine(self, coro):
+    return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
 try:
     volapi_internal.EVENT_TYPES += "pulse", "call",
 except AttributeError:
     pass
+ARBITRATOR.pulses = PulseScheduler()
+ARBITRATOR.ticker = None
 ARBITRATOR.start_pulse = MethodType(pulse, ARBITRATOR)
+ARBITRATOR.stop_pulse = MethodType(unpulse, ARBITRATOR)
+ARBITRATOR.timers = Timers(ARBITRATOR.loop)
+ARBITRATOR.schedule = MethodType(_schedule, ARBITRATOR)
 ARBITRATOR.call_later = MethodType(_call_later, ARBITRATOR)
+ARBITRATOR.call_later_keyed = MethodType(_call_later_keyed, ARBITRATOR)
 ARBITRATOR.run_process = MethodType(_run_process, ARBITRATOR)
+ARBITRATOR.run_coroutine = MethodType(_run_coroutine, ARBITRATOR)
@@ -10,3 +10,4 @@ from .tard import *
 from .web import *
 from .pulse import *
 from .request import *
+from .search import *
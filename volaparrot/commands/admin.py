@@ -20,13 +20,18 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
+from volapi.arbritrator import ARBITRATOR
+
+from ..perf import LATENESS, PERF
+from ..sqlprof import SQLPERF
 from .command import BaseCommand, Command
 
 
-__all__ = ["AdminActivateCommand"]
+__all__ = ["AdminActivateCommand", "PerfCommand", "SQLPerfCommand", "TimersCommand"]
 
 class AdminActivateCommand(Command):
     handlers = ".active", ".ded"
+    priority = True
 
     def handle_cmd(self, cmd, remainder, msg):
         if not self.isadmin(msg):
@@ -39,3 +44,97 @@ class AdminActivateCommand(Command):
             BaseCommand.set_global_active(True)
             self.post("Let the spam commence")
         return True
+
+
+class PerfCommand(Command):
+    handlers = ".perf"
+    priority = True
+
+    keys = {
+        "time": lambda stat: stat.total,
+        "calls": lambda stat: stat.calls,
+        "errors": lambda stat: stat.errors,
+        "max": lambda stat: stat.max,
+        "p99": lambda stat: stat.percentile(99),
+        }
+
+    def handle_perf(self, cmd, remainder, msg):
+        if not self.isadmin(msg):
+            self.post("{}: Your performance is lacking anyway", msg.nick)
+            return True
+        words = remainder.lower().split()
+        room = self.room.name if "here" in words else None
+        perf = LATENESS if "late" in words else PERF
+        key = next((self.keys[w] for w in words if w in self.keys), self.keys["time"])
+        top = perf.top(5, room=room, key=key)
+        if not top:
+            self.post("{}: Nothing measured yet", msg.nick)
+            return True
+        # A post per row, the outbox packs as many as fit into a message
+        for (kind, command), stat in top:
+            self.post(
+                "{} {}: {}x, {:.1f}ms avg, {:.1f}ms p99, {:.1f}ms max, {} errs",
+                kind, command, stat.calls, stat.mean * 1000,
+                stat.percentile(99) * 1000, stat.max * 1000, stat.errors)
+        return True
+
+
+class SQLPerfCommand(Command):
+    handlers = ".sqlperf"
+    priority = True
+
+    def handle_sqlperf(self, cmd, remainder, msg):
+        if not self.isadmin(msg):
+            self.post("{}: DROP TABLE you", msg.nick)
+            return True
+        words = remainder.lower().split()
+        if "reset" in words:
+            SQLPERF.reset()
+            self.post("{}: Forgot all statements", msg.nick)
+            return True
+        if "trace" in words:
+            SQLPERF.tracing = not SQLPERF.tracing
+            self.post("{}: Tracing {}", msg.nick, "on" if SQLPERF.tracing else "off")
+            return True
+        keys = PerfCommand.keys
+        key = next((keys[w] for w in words if w in keys), keys["time"])
+        top = SQLPERF.top(3, key=key)
+        if not top:
+            self.post("{}: Nothing measured yet", msg.nick)
+            return True
+        for (_, stmt), stat in top:
+            self.post(
+                "{}x {:.1f}ms avg {:.1f}ms max {}k ops: {:.50}",
+                stat.calls, stat.mean * 1000, stat.max * 1000,
+                SQLPERF.steps_of(stmt) // 1000, stmt)
+        return True
+
+
+class TimersCommand(Command):
+    handlers = ".timers"
+    priority = True
+
+    def handle_timers(self, cmd, remainder, msg):
+        if not self.isadmin(msg):
+            self.post("{}: Your time is up", msg.nick)
+            return True
+        # pylint: disable=no-member
+        if "all" in remainder.lower().split():
+            pending = ARBITRATOR.timers.pending()
+            if not pending:
+                self.post("{}: No timers pending anywhere", msg.nick)
+                return True
+            # A post per line, the outbox packs as many as fit into a message
+            self.post("{}: {} rooms with timers", msg.nick, len(pending))
+            for room, timers in sorted(
+                    pending.items(), key=lambda i: len(i[1]), reverse=True)[:8]:
+                self.post("{}: {}", room.name, len(timers))
+            return True
+        pending = ARBITRATOR.timers.pending(self.room)
+        if not pending:
+            self.post("{}: No timers pending", msg.nick)
+            return True
+        self.post("{}: {} pending", msg.nick, len(pending))
+        for timer in pending[:8]:
+            self.post("{!r}", timer)
+        return True
@@ -21,34 +21,97 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 import logging
+import re
 import warnings
 
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import partial
+
 from volapi.arbritrator import ARBITRATOR
 
+from ..outbox import Outbox
+from ..waiters import FileWaiters
+
 
-__all__ = ["BaseCommand", "Command", "FileCommand", "PulseCommand"]
+__all__ = ["RoomContext", "BaseCommand", "Command", "FileCommand", "PulseCommand"]
 
 LOGGER = logging.getLogger(__name__)
 
+CONTEXT = ContextVar("room_context")
+
+
+class RoomContext:
+    """
+    Per-room state for the command instances, which are shared by all rooms.
+    Commands see the context of the room they are currently running for as
+    self.room, self.mute and self.local, and post through its outbox.
+    """
+
+    def __init__(self, room, args, registry=None):
+        self.room = room
+        self.registry = registry
+        self.mute = room.name in args.muterooms
+        self.outbox = Outbox(room, window=args.post_window, rate=args.post_rate)
+        self.waiters = FileWaiters()
+        self.locals = defaultdict(dict)
+
+    def run(self, func, *args, **kw):
+        token = CONTEXT.set(self)
+        try:
+            return func(*args, **kw)
+        finally:
+            CONTEXT.reset(token)
+
+    def __repr__(self):
+        return "<RoomContext({!r})>".format(self.room)
+
 
 class BaseCommand:
     _active = True
-    mute = False
     shitposting = False
+    # Posts of priority commands skip ahead in the outbox
+    priority = False
+    # Seconds post_fid waits for a file before giving up
+    fid_timeout = 120
     handlers = ()
+    pattern = None
+    # Commands are tried in the order of this key, the class name by default
+    order = None
 
-    def __init__(self, room, *args, **kw):
-        self.room = room
-        self.mute = room.name in kw.get("args").muterooms
-
+    def __init__(self, *args, **kw):
         handlers = getattr(self, "handlers", list())
         if isinstance(handlers, str):
             handlers = handlers,
         self._handlers = list(i.casefold() for i in handlers)
+        if isinstance(self.pattern, str):
+            self.pattern = re.compile(self.pattern, re.I)
         args, kw = kw, args
 
     def handles(self, cmd):
-        return cmd in self._handlers
+        if cmd in self._handlers:
+            return True
+        return bool(self.pattern and self.pattern.match(cmd))
+
+    @property
+    def context(self):
+        try:
+            return CONTEXT.get()
+        except LookupError:
+            raise RuntimeError("{!r} used outside of a room".format(self)) from None
+
+    @property
+    def room(self):
+        return self.context.room
+
+    @property
+    def mute(self):
+        return self.context.mute
+
+    @property
+    def local(self):
+        """Per-room state of this command"""
+        return self.context.locals[self]
 
     @property
     def active(self):
@@ -68,21 +131,38 @@ class BaseCommand:
         if not self.active:
             LOGGER.info("Swallowed %s", msg)
             return
-        self.room.post_chat(msg)
+        self.context.outbox.post(msg, self.priority, self)
 
     def post_fid(self, fid, msg, *args, **kw):
-        if fid not in self.room.filedict:
-            self.call_later(1, self.post_fid, fid, msg, *args, **kw)
+        """Post once the file fid is visible in the room"""
+        if fid in self.room.filedict:
+            self.post(msg, *args, **kw)
             return
-        self.post(msg, *args, **kw)
+        post = partial(self.post, msg, *args, **kw)
+        waiters = self.context.waiters
+        timer = self.call_later(self.fid_timeout, self._fid_timeout, fid, post)
+        waiters.wait(fid, post, timer)
+        # The file might have arrived in the meantime
+        if fid in self.room.filedict and waiters.expire(fid, post):
+            post()
+
+    def _fid_timeout(self, fid, post):
+        if self.context.waiters.expire(fid, post):
+            LOGGER.warning("Gave up waiting for %s in %r", fid, self.room)
 
     @staticmethod
     def nonotify(nick):
         return "{}\u2060{}".format(nick[0], nick[1:])
 
     def call_later(self, delay, callback, *args, **kw):
+        """Returns a Timer that may be cancelled, or None if over the limit"""
         # pylint: disable=no-member
-        ARBITRATOR.call_later(self.room, delay, callback, *args, **kw)
+        return ARBITRATOR.call_later(self.room, delay, callback, *args, **kw)
+
+    def call_later_keyed(self, key, delay, callback, *args, **kw):
+        """Like call_later, but a pending callback + key is not scheduled again"""
+        # pylint: disable=no-member
+        return ARBITRATOR.call_later_keyed(self.room, key, delay, callback, *args, **kw)
 
     def run_process(self, callback, *args):
         # pylint: disable=no-member
@@ -120,15 +200,8 @@ class PulseCommand(BaseCommand):
 
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
-        self.last_interval = 0
         if self.interval <= 0:
             raise RuntimeError("No valid interval")
 
-    def check_interval(self, current, interval=1.0):
-        result = current >= self.last_interval + interval
-        if result:
-            self.last_interval = current
-        return result
-
     def onpulse(self, current):
         raise NotImplementedError()
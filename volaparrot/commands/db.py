@@ -20,37 +20,52 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
-import sqlite3
-
-__all__ = ["DBCommand"]
-
-
-def _init_conn():
-    conn = sqlite3.connect("phrases2.db")
-    conn.isolation_level = None
-    conn.execute("CREATE TABLE IF NOT EXISTS phrases ("
-                 "phrase TEXT PRIMARY KEY, "
-                 "text TEXT, "
-                 "locked INT, "
-                 "owner TEXT"
-                 ")")
-    conn.execute("CREATE TABLE IF NOT EXISTS files ("
-                 "phrase TEXT PRIMARY KEY, "
-                 "id TEXT, "
-                 "name TEXT, "
-                 "locked INT, "
-                 "owner TEXT"
-                 ")")
-    conn.execute("CREATE TABLE IF NOT EXISTS rooms ("
-                 "room TEXT PRIMARY KEY, "
-                 "title TEXT, "
-                 "users INT, "
-                 "files INT, "
-                 "alive INT DEFAULT 1, "
-                 "firstadded INT DEFAULT 0 "
-                 ")")
-    return conn
+from ..storage import Database
+
+__all__ = ["DBCommand", "PHRASESDB", "MERCDB"]
+
+
+PHRASESDB = Database("phrases2.db", (
+    "CREATE TABLE IF NOT EXISTS phrases ("
+    "phrase TEXT PRIMARY KEY, "
+    "text TEXT, "
+    "locked INT, "
+    "owner TEXT"
+    ")",
+    "CREATE TABLE IF NOT EXISTS files ("
+    "phrase TEXT PRIMARY KEY, "
+    "id TEXT, "
+    "name TEXT, "
+    "locked INT, "
+    "owner TEXT"
+    ")",
+    "CREATE TABLE IF NOT EXISTS rooms ("
+    "room TEXT PRIMARY KEY, "
+    "title TEXT, "
+    "users INT, "
+    "files INT, "
+    "alive INT DEFAULT 1, "
+    "firstadded INT DEFAULT 0 "
+    ")",
+    ))
+
+MERCDB = Database("merc.db", (
+    "CREATE TABLE IF NOT EXISTS merc (ts INT PRIMARY KEY, msg TEXT)",
+    "CREATE TABLE IF NOT EXISTS red (ts INT PRIMARY KEY, msg TEXT)",
+    ))
 
 
 class DBCommand:
-    conn = _init_conn()
+    db = PHRASESDB
+
+    @property
+    def conn(self):
+        """Read connection of the current thread; write through self.db"""
+        return self.db.reader
+
+    def commit(self, sql, params=()):
+        """
+        Write and wait for it to be committed, raising what failed.
+        For writes the user gets a reply to, or that are read back.
+        """
+        return self.db.write(sql, params).result()
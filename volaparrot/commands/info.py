@@ -24,14 +24,15 @@ THE SOFTWARE.
 
 import logging
 
+from array import array
+from threading import Lock
 from time import time
 from datetime import datetime, timedelta
 
 from humanize import naturaldelta
-from cachetools import LRUCache
 
 from .._version import __version__, __fulltitle__
-from ..utils import get_text, get_json
+from ..utils import get_text
 from .command import Command, PulseCommand
 from .db import DBCommand
 
@@ -122,11 +123,7 @@ class CheckModCommand(Command):
         user = remainder if remainder and " " not in remainder else "MercWMouth"
         LOGGER.debug("Getting user %s", user)
         try:
-            text, exp = get_text("https://volafile.org/user/{}".format(user))
-            if time() - exp > 120:
-                get_text.cache_clear()
-                get_json.cache_clear()
-                text, exp = get_text("https://volafile.org/user/{}".format(user))
+            text, _ = get_text("https://volafile.org/user/{}".format(user), ttl=120)
             if "Error 404" in text:
                 LOGGER.info("Not a user %s", user)
                 return False
@@ -157,10 +154,87 @@ class AboutCommand(Command):
         return True
 
 
+class SeenStore:
+    """
+    Last seen times of a lot of nicks, without any objects per nick: the
+    names utf-8 encoded back to back in a bytearray, the times in an array
+    of doubles, both by slot, and an open addressing table of the slots by
+    name hash. Plus the slots changed since the last flush.
+    Not thread-safe, lock around it.
+    """
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.ends = array("L")
+        self.times = array("d")
+        self.table = array("l", [-1]) * 8
+        self.dirty = set()
+
+    def _name(self, slot):
+        return self.blob[self.ends[slot - 1] if slot else 0:self.ends[slot]]
+
+    def _find(self, key):
+        """Table index of the encoded name key and its slot, or -1"""
+        mask = len(self.table) - 1
+        index = hash(key) & mask
+        while True:
+            slot = self.table[index]
+            if slot < 0 or self._name(slot) == key:
+                return index, slot
+            index = (index + 1) & mask
+
+    def _grow(self):
+        self.table = array("l", [-1]) * (len(self.table) * 2)
+        for slot in range(len(self.times)):
+            index, _ = self._find(bytes(self._name(slot)))
+            self.table[index] = slot
+
+    def load(self, rows):
+        for name, seen in rows:
+            self.set(name, seen, False)
+
+    def set(self, name, seen, dirty=True):
+        key = name.encode("utf-8")
+        index, slot = self._find(key)
+        if slot < 0:
+            slot = self.table[index] = len(self.times)
+            self.blob += key
+            self.ends.append(len(self.blob))
+            self.times.append(seen)
+            # At most two thirds full, so probes stay short
+            if len(self.times) * 3 > len(self.table) * 2:
+                self._grow()
+        else:
+            self.times[slot] = seen
+        if dirty:
+            self.dirty.add(slot)
+
+    def get(self, name):
+        _, slot = self._find(name.encode("utf-8"))
+        return None if slot < 0 else self.times[slot]
+
+    def take_dirty(self):
+        """Pops the changed (name, time) pairs"""
+        dirty, self.dirty = self.dirty, set()
+        return [(self._name(slot).decode("utf-8"), self.times[slot]) for slot in dirty]
+
+    def mark_dirty(self, names):
+        self.dirty.update(self._find(name.encode("utf-8"))[1] for name in names)
+
+    def oldest(self):
+        return min(self.times) if self.times else None
+
+    def __len__(self):
+        return len(self.times)
+
+
 class SeenCommand(DBCommand, Command, PulseCommand):
+    # Sees every message, handles only these
+    handlers = "!seen"
     interval = 5 * 60
 
-    seen = LRUCache(maxsize=50)
+    seen = SeenStore()
+    lock = Lock()
     start = time()
 
     usermap = {
@@ -202,47 +276,67 @@ class SeenCommand(DBCommand, Command, PulseCommand):
         "wombatfucker": "NEPTVola",
         }
 
+    # Casefolded alias -> casefolded name, as seen is keyed by
+    keymap = {k.casefold(): v.casefold() for k, v in usermap.items()}
 
     def mapname(self, name):
         if name.startswith("Xsa"):
             return "Xsa"
         return self.usermap.get(name.lower(), name)
 
+    def mapkey(self, name):
+        if name.startswith("Xsa"):
+            return "xsa"
+        name = name.casefold()
+        return self.keymap.get(name, name)
+
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
-        self.conn.execute("CREATE TABLE IF NOT EXISTS seen ("
-                          "user TEXT PRIMARY KEY, "
-                          "time INT"
-                          ")")
+        self.db.write("CREATE TABLE IF NOT EXISTS seen ("
+                      "user TEXT PRIMARY KEY, "
+                      "time INT"
+                      ")").result()
         try:
             cur = self.conn.cursor()
-            cur.execute("SELECT time FROM seen ORDER BY time ASC LIMIT 1")
-            self.start = int(cur.fetchone()[0]) / 1000
+            cur.execute("SELECT user, time FROM seen")
+            with self.lock:
+                self.seen.load((user, int(seen) / 1000) for user, seen in cur)
+                oldest = self.seen.oldest()
+            if oldest:
+                SeenCommand.start = oldest
+            LOGGER.info("Loaded %d seen users", len(self.seen))
         except Exception:
-            LOGGER.exception("Failed to get min seen")
+            LOGGER.exception("Failed to load seen")
 
 
     def handles(self, cmd):
         return True
 
     def onpulse(self, pulse):
-        try:
-            LOGGER.debug("Dumping seen to db")
-            cur = self.conn.cursor()
-            cur.executemany(
-                "INSERT OR REPLACE INTO seen VALUES(?, ?)",
-                list((u, int(v * 1000)) for u, v in self.seen.items())
-                )
-        except Exception:
-            LOGGER.exception("Failed to update seen")
+        LOGGER.debug("Dumping seen to db")
+        with self.lock:
+            items = list((u, int(v * 1000)) for u, v in self.seen.take_dirty())
+        if not items:
+            return
+
+        def written(fut):
+            if fut.exception():
+                LOGGER.error("Failed to update seen")
+                with self.lock:
+                    self.seen.mark_dirty(u for u, _ in items)
+
+        self.db.executemany(
+            "INSERT OR REPLACE INTO seen VALUES(?, ?)", items).add_done_callback(written)
 
     def handle_cmd(self, cmd, remainder, msg):
-        nick = self.mapname(msg.nick).casefold()
-        self.seen[nick] = time()
-        if msg.admin or msg.staff:
-            self.seen["@{}".format(nick)] = time()
-        if msg.logged_in:
-            self.seen["+{}".format(nick)] = time()
+        nick = self.mapkey(msg.nick)
+        now = time()
+        with self.lock:
+            self.seen.set(nick, now)
+            if msg.admin or msg.staff:
+                self.seen.set("@{}".format(nick), now)
+            if msg.logged_in:
+                self.seen.set("+{}".format(nick), now)
 
         if cmd != "!seen":
             return False
@@ -250,14 +344,10 @@ class SeenCommand(DBCommand, Command, PulseCommand):
             return False
 
         remainder = remainder.strip()
+        crem = self.mapkey(remainder)
         remainder = self.mapname(remainder)
-        crem = remainder.casefold()
-        seen = self.seen.get(crem)
-        if not seen:
-            cur = self.conn.cursor()
-            cur.execute("SELECT time FROM seen WHERE user = ?", (crem,))
-            seen = cur.fetchone()
-            seen = seen and int(seen[0]) / 1000
+        with self.lock:
+            seen = self.seen.get(crem)
         if remainder.lower() == "lain":
             self.post(
                 "Lain was never here, will never come here, "
@@ -274,6 +364,8 @@ class SeenCommand(DBCommand, Command, PulseCommand):
 
 
 class AsleepCommand(Command):
+    # Sees every message, handles only these
+    handlers = "!asleep"
     last = None
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
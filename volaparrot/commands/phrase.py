@@ -24,9 +24,15 @@ THE SOFTWARE.
 import logging
 
 from collections import namedtuple
-from io import BytesIO
+from functools import partial
+from tempfile import SpooledTemporaryFile
+from threading import Lock
 from time import time
 
+from ..export import ExportCommand
+from ..fuzzy import TrigramIndex
+from ..importer import POLICIES, import_phrases, open_lines
+from ..utils import requests
 from .command import Command
 from .db import DBCommand
 
@@ -36,6 +42,7 @@ __all__ = [
     "AdminDefineCommand",
     "DefineCommand",
     "PhrasesUploadCommand",
+    "ImportCommand",
     "XResponderCommand",
     ]
 
@@ -45,37 +52,106 @@ LOGGER = logging.getLogger(__name__)
 class PhraseCommand(DBCommand):
     phrase = namedtuple("Phrase", ["phrase", "text", "locked", "owner"])
     changed = 0
+    # All phrases, loaded once and kept up to date by set/unlock/del_phrase.
+    # Being complete, a miss here is authoritative and costs no query.
+    phrases = None
+    # Trigram index of the phrase keys, built on the first miss
+    fuzzy = None
+    lock = Lock()
 
     @staticmethod
     def to_phrase(data):
         return PhraseCommand.phrase(*data)
 
+    @property
+    def phrasemap(self):
+        phrases = PhraseCommand.phrases
+        if phrases is not None:
+            return phrases
+        with PhraseCommand.lock:
+            return self._load()
+
+    def _load(self):
+        """The phrases, loaded if needed; hold the lock"""
+        if PhraseCommand.phrases is None:
+            # Writes of the map still queued have to be visible
+            self.db.flush()
+            cur = self.conn.cursor()
+            PhraseCommand.phrases = {
+                row[0]: self.to_phrase(row)
+                for row in cur.execute(
+                    "SELECT phrase, text, locked, owner FROM phrases")}
+            LOGGER.info("Loaded %d phrases", len(PhraseCommand.phrases))
+        return PhraseCommand.phrases
+
+    @property
+    def phraseindex(self):
+        fuzzy = PhraseCommand.fuzzy
+        if fuzzy is not None:
+            return fuzzy
+        with PhraseCommand.lock:
+            if PhraseCommand.fuzzy is None:
+                PhraseCommand.fuzzy = TrigramIndex(list(self._load()))
+            return PhraseCommand.fuzzy
+
+    def similar_phrases(self, phrase, num=3):
+        return self.phraseindex.suggest(phrase.casefold(), num)
+
+    @staticmethod
+    def touch():
+        PhraseCommand.changed = time()
+        LOGGER.debug("changed %d", PhraseCommand.changed)
+
+    @staticmethod
+    def reload():
+        """Forget what is in memory, after changing phrases behind our back"""
+        with PhraseCommand.lock:
+            # Nothing queued may be lost, the map is all there was to it
+            PhraseCommand.db.flush()
+            PhraseCommand.phrases = None
+            PhraseCommand.fuzzy = None
+        PhraseCommand.touch()
+
     def get_phrase(self, phrase):
         phrase = phrase.casefold()
         if not phrase:
             return None
-        cur = self.conn.cursor()
-        phrase = cur.execute("SELECT phrase, text, locked, owner FROM phrases "
-                             "WHERE phrase = ?",
-                             (phrase,)).fetchone()
-        return self.to_phrase(phrase) if phrase else phrase
+        return self.phrasemap.get(phrase)
+
+    # Changes are committed, then go to the map (and index, if any), all
+    # under the lock, so they cannot fall between the two, or between a
+    # reload and a load. Failures raise and leave the map alone.
 
     def set_phrase(self, phrase, text, locked, owner):
-        cur = self.conn.cursor()
-        cur.execute("INSERT OR REPLACE INTO phrases VALUES(?, ?, ?, ?)",
-                    (phrase.casefold(), text, 1 if locked else 0, owner))
-        PhraseCommand.changed = time()
-        LOGGER.debug("changed %d", self.changed)
+        phrase = self.to_phrase((phrase.casefold(), text, 1 if locked else 0, owner))
+        with PhraseCommand.lock:
+            self.commit("INSERT OR REPLACE INTO phrases VALUES(?, ?, ?, ?)", phrase)
+            phrases = PhraseCommand.phrases
+            if phrases is not None:
+                if phrase.phrase not in phrases and PhraseCommand.fuzzy is not None:
+                    PhraseCommand.fuzzy.add(phrase.phrase)
+                phrases[phrase.phrase] = phrase
+        self.touch()
 
     def unlock_phrase(self, phrase):
-        cur = self.conn.cursor()
-        cur.execute("UPDATE phrases SET locked = 0 WHERE phrase = ?",
-                    (phrase.casefold(),))
+        phrase = phrase.casefold()
+        with PhraseCommand.lock:
+            self.commit("UPDATE phrases SET locked = 0 WHERE phrase = ?", (phrase,))
+            phrases = PhraseCommand.phrases
+            existing = phrases and phrases.get(phrase)
+            if existing:
+                phrases[phrase] = existing._replace(locked=0)
+        self.touch()
 
     def del_phrase(self, phrase):
-        cur = self.conn.cursor()
-        cur.execute("DELETE FROM phrases WHERE phrase = ?",
-                    (phrase.casefold(),))
+        phrase = phrase.casefold()
+        with PhraseCommand.lock:
+            self.commit("DELETE FROM phrases WHERE phrase = ?", (phrase,))
+            phrases = PhraseCommand.phrases
+            if phrases is not None and phrases.pop(phrase, None) \
+                    and PhraseCommand.fuzzy is not None:
+                PhraseCommand.fuzzy.remove(phrase)
+        self.touch()
 
 
 class AdminDefineCommand(PhraseCommand, Command):
@@ -85,10 +161,15 @@ class AdminDefineCommand(PhraseCommand, Command):
         if not self.isadmin(msg):
             self.post("{}: FUCK YOU!", msg.nick)
             return True
-        if cmd == "!undef":
-            self.del_phrase(remainder)
-        elif cmd == "!unlock":
-            self.unlock_phrase(remainder)
+        try:
+            if cmd == "!undef":
+                self.del_phrase(remainder)
+            elif cmd == "!unlock":
+                self.unlock_phrase(remainder)
+        except Exception:
+            LOGGER.exception("Failed to change %s", remainder)
+            self.post("{}: Failed to change that, see the log", msg.nick)
+            return True
         self.post("Yes master {}", msg.nick)
         return True
 
@@ -118,40 +199,72 @@ class DefineCommand(PhraseCommand, Command):
                       msg.nick, self.nonotify(self.admins[0]))
             return True
 
-        self.set_phrase(phrase, remainder, admin, msg.nick)
+        try:
+            self.set_phrase(phrase, remainder, admin, msg.nick)
+        except Exception:
+            LOGGER.exception("Failed to define %s", phrase)
+            self.post("{}: Failed to define that, see the log", msg.nick)
+            return True
         self.post("{}: KOK", msg.nick)
         return True
 
 
-class PhrasesUploadCommand(Command, PhraseCommand):
+class PhrasesUploadCommand(Command, PhraseCommand, ExportCommand):
     handlers = "!phrases"
-    uploaded = 0
-    upload = None
 
     def handle_phrases(self, cmd, remainder, msg):
         if not self.allowed(msg):
             return True
-        valid = self.upload
-        if valid:
-            valid = {f.id: f for f in self.room.files}.get(valid)
-            valid = valid and not valid.expired
-        LOGGER.debug("valid %s %d %d", valid, self.uploaded, PhraseCommand.changed)
-        if not self.upload or self.uploaded < PhraseCommand.changed:
-            cur = self.conn.cursor()
-            phrases = "\r\n".join("{}|{}".format(*row)
-                                  for row in cur.execute("SELECT phrase, text "
-                                                         "FROM phrases "
-                                                         "ORDER BY phrase"))
-            with BytesIO(bytes(phrases, "utf-8")) as upload:
-                if self.active:
-                    self.upload = self.room.upload_file(upload,
-                                                        upload_as="phrases.txt")
-                self.uploaded = time()
-        self.post("{}: @{}", remainder or msg.nick, self.upload)
+        lines = self.export_lines("SELECT phrase, text FROM phrases ORDER BY phrase")
+        self.upload_export(
+            "phrases.txt", lines, PhraseCommand.changed,
+            partial(self.post, "{}: @{}", remainder or msg.nick))
+        return True
+
+
+class ImportCommand(PhraseCommand, Command):
+    handlers = "!import"
+    # Seconds between progress reports
+    report = 10
+
+    def handle_import(self, cmd, remainder, msg):
+        if not self.isadmin(msg):
+            self.post("{}: FUCK YOU!", msg.nick)
+            return True
+        policy = remainder.split()[-1] if remainder.split() else "keep-locked"
+        if len(msg.files) != 1 or policy not in POLICIES:
+            self.post("{}: !import @file [{}]", msg.nick, "|".join(POLICIES))
+            return True
+
+        file = msg.files[0]
+        last = time()
+
+        def progress(res):
+            nonlocal last
+            if last + self.report > time():
+                return
+            last = time()
+            self.post("{}: {} imported so far", msg.nick, res.imported)
+
+        with requests.get(file.url, stream=True) as resp, \
+                SpooledTemporaryFile(1 << 20) as data:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(1 << 16):
+                data.write(chunk)
+            data.seek(0)
+            res = import_phrases(
+                self.db, open_lines(data, file.name.endswith(".gz")),
+                policy=policy, owner=msg.nick, progress=progress)
+        self.reload()
+        self.post("{}: {} imported, {} skipped, {} broken lines, took {:.1f}s",
+                  msg.nick, res.imported, res.skipped, res.bad, res.elapsed)
         return True
 
 
 class XResponderCommand(PhraseCommand, Command):
+    # Shortest "!cmd" to suggest phrases for
+    suggest_min = 4
+
     def handles(self, cmd):
         return bool(cmd)
 
@@ -177,9 +290,24 @@ class XResponderCommand(PhraseCommand, Command):
             if phrase:
                 self.post("{}: {}", remainder or nick, phrase.text)
                 return True
+            # Later catch-alls still get their go, suggestion or not
+            self.suggest(cmd, nick)
 
         return self.shitposting and self.shitpost(nick, msg)
 
+    def suggest(self, cmd, nick):
+        """Did you mean, for misses that are no other command either"""
+        if len(cmd) < self.suggest_min:
+            return False
+        registry = self.context.registry
+        if registry and registry.known(cmd):
+            return False
+        similar = self.similar_phrases(cmd[1:])
+        if not similar:
+            return False
+        self.post("{}: Did you mean {}?", nick, ", ".join("!" + s for s in similar))
+        return True
+
 
     def shitpost(self, nick, msg):
         lmsg = msg.msg.lower()
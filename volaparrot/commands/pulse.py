@@ -23,10 +23,14 @@ THE SOFTWARE.
 
 import logging
 
+from threading import Lock
+
+from ..perf import LATENESS, PERF
+from ..sqlprof import SQLPERF
 from .command import PulseCommand
 
 
-__all__ = ["CurrentTimeCommand"]
+__all__ = ["CurrentTimeCommand", "PerfDumpCommand"]
 
 LOGGER = logging.getLogger(__name__)
 
@@ -34,9 +38,28 @@ LOGGER = logging.getLogger(__name__)
 class CurrentTimeCommand(PulseCommand):
     interval = 60.0
     last = 0
+    # The pulses of all rooms come due together, on different workers
+    lock = Lock()
 
     def onpulse(self, current):
-        if abs(CurrentTimeCommand.last - current) < 10:
-            return
-        CurrentTimeCommand.last = current
+        with self.lock:
+            if abs(CurrentTimeCommand.last - current) < 10:
+                return
+            CurrentTimeCommand.last = current
         LOGGER.info("%r: got pulsed %.2f", self.room, current)
+
+
+class PerfDumpCommand(PulseCommand):
+    interval = 15 * 60.0
+    last = 0
+    lock = Lock()
+
+    def onpulse(self, current):
+        # Pulsed by every room, but one dump per interval is plenty
+        with self.lock:
+            if PerfDumpCommand.last + self.interval > current:
+                return
+            PerfDumpCommand.last = current
+        LOGGER.info("Command performance:\n%s", PERF.table())
+        LOGGER.info("Pulse lateness:\n%s", LATENESS.table())
+        LOGGER.info("SQL performance:\n%s", SQLPERF.table())
@@ -23,6 +23,7 @@ THE SOFTWARE.
 # pylint: disable=unused-argument
 from datetime import datetime
 from io import BytesIO
+from threading import Lock
 from time import time
 
 from cachetools import LRUCache
@@ -36,6 +37,7 @@ __all__ = ["RequestCommand"]
 class RequestCommand(Command):
     handlers = "!request"
     cooldown = LRUCache(maxsize=20)
+    lock = Lock()
     timeout = 1*60*60
 
     def handle_request(self, cmd, remainder, msg):
@@ -43,14 +45,16 @@ class RequestCommand(Command):
             return False
         if not self.allowed(msg):
             return False
-        if self.cooldown.get(msg.nick.lower(), 0) + self.timeout > time():
-            self.post("{}, pls wait", msg.nick)
-            return True
+        nick = msg.nick.lower()
+        with self.lock:
+            if self.cooldown.get(nick, 0) + self.timeout > time():
+                self.post("{}, pls wait", msg.nick)
+                return True
+            self.cooldown[nick] = time()
         data = BytesIO("{} requested this on {}\nEverybody ignored it always".format(
             msg.nick,
             datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
             ).encode("utf-8"))
         name = "[REQUEST] {} - {}".format(remainder.strip(), msg.nick)
         self.room.upload_file(data, upload_as=name)
-        self.cooldown[msg.nick.lower()] = time()
         return True
@@ -0,0 +1,96 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# pylint: disable=unused-argument
+import logging
+
+from .. import fts
+from .command import Command
+from .db import PHRASESDB
+from .phrase import PhraseCommand
+
+
+__all__ = []
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_RESULTS = 30
+
+
+def _indexed(fut):
+    try:
+        fut.result()
+    except Exception:
+        LOGGER.exception("Failed to build the phrase search index")
+
+
+class SearchCommand(PhraseCommand, Command):
+    handlers = "!search"
+
+    @staticmethod
+    def to_query(terms):
+        """Plain words to an FTS query, all of which must (prefix) match"""
+        return " ".join(
+            '"{}"*'.format(term.replace('"', '""')) for term in terms.split())
+
+    def search(self, terms, limit=MAX_RESULTS):
+        cur = self.conn.cursor()
+        return [row[0] for row in cur.execute(
+            "SELECT i.phrase FROM phrases_fts "
+            "JOIN phrases_ids AS i ON i.id = phrases_fts.rowid "
+            "WHERE phrases_fts MATCH ? "
+            "ORDER BY bm25(phrases_fts) LIMIT ?",
+            (self.to_query(terms), limit))]
+
+    def handle_search(self, cmd, remainder, msg):
+        if not self.allowed(msg):
+            return False
+        terms = remainder.strip()
+        if not terms:
+            return False
+        if not INDEX.done():
+            self.post("{}: Still indexing, try again later", msg.nick)
+            return True
+        if INDEX.exception():
+            return False
+        found = self.search(terms)
+        if not found:
+            self.post("{}: Nothing, try harder", msg.nick)
+            return True
+        result = "{}:".format(msg.nick)
+        for phrase in found:
+            cur = " !{}".format(phrase)
+            if len(result) + len(cur) > 295:
+                result += " …"
+                break
+            result += cur
+        self.post("{}", result)
+        return True
+
+
+if fts.available():
+    # Built on the writer, in the background; a new index takes a while
+    INDEX = PHRASESDB.transact(fts.create, "phrases", ("phrase", "text"))
+    INDEX.add_done_callback(_indexed)
+    __all__ += "SearchCommand",
+else:
+    LOGGER.warning("Cannot use FTS5, SearchCommand is not available")
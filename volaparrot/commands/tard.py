@@ -25,11 +25,13 @@ import random
 import re
 
 from subprocess import Popen, PIPE, TimeoutExpired
-from sqlite3 import Connection
+from threading import Lock
 
 from cachetools import LRUCache
 
 from .command import Command
+from ..storage import QuotePool
+from .db import MERCDB
 
 
 __all__ = [
@@ -149,9 +151,7 @@ class XDanielCommand(Command):
 
 
 class ChenCommand(Command):
-    def handles(self, cmd):
-        if re.match(r"\!che+n$", cmd, re.I):
-            return True
+    pattern = r"\!che+n$"
 
     def handle_cmd(self, cmd, remainder, msg):
         if not self.allowed(msg):
@@ -165,6 +165,7 @@ class ProfanityCommand(Command):
     extract = re.compile(r"1:.*?\s+warning\s+(.*?)\s\S+$")
     handlers = "!analyze", "!sjw", "!profanity"
     lru = LRUCache(maxsize=20)
+    lock = Lock()
 
     def handles(self, cmd):
         return True
@@ -184,17 +185,19 @@ class ProfanityCommand(Command):
 
     def handle_cmd(self, cmd, remainder, msg):
         if cmd not in self.handlers:
-            self.lru[msg.nick.casefold()] = (msg.nick, msg.msg)
+            with self.lock:
+                self.lru[msg.nick.casefold()] = (msg.nick, msg.msg)
             return False
 
         if not self.allowed(msg):
             return False
         try:
-            if remainder:
-                user = remainder.strip().casefold()
-                user, text = self.lru.get(user, (None, None))
-            else:
-                user, text = self.lru.items()[0][1]
+            with self.lock:
+                if remainder:
+                    user = remainder.strip().casefold()
+                    user, text = self.lru.get(user, (None, None))
+                else:
+                    user, text = self.lru.items()[0][1]
             if not text:
                 return False
             anal = ", ".join(self.alex(text))
@@ -218,7 +221,7 @@ class ProfanityCommand(Command):
 
 class RedardCommand(Command):
     redard = re.compile(r"\bredard\b", re.I)
-    database = Connection("merc.db", isolation_level=None)
+    quotes = QuotePool(MERCDB, "red", "msg", repeat=True)
 
     def handles(self, cmd):
         return bool(cmd)
@@ -228,12 +231,10 @@ class RedardCommand(Command):
             return False
         if not self.redard.search(msg.msg):
             return False
-        cur = self.database.cursor()
-        cur.execute("SELECT msg FROM red ORDER BY RANDOM() LIMIT 1")
-        quote = cur.fetchone()
+        quote = self.quotes.draw()
         if not quote:
             return False
-        self.post(">Red: {}", quote[0])
+        self.post(">Red: {}", quote)
         return True
 
 try:
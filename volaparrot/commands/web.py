@@ -25,13 +25,14 @@ import logging
 import html
 import re
 
-from time import time
-
 import isodate
 
-from cachetools import LRUCache
+from cachetools import TTLCache
 
-from ..utils import get_text, get_json
+from ..arb import ARBITRATOR
+from ..htmlhead import fetch_head
+from ..unfurl import UNFURLER, normalize_url
+from ..utils import get_json
 from .command import Command
 
 
@@ -43,14 +44,82 @@ __all__ = [
     "XRedditCommand",
     "XGithubIssuesCommand",
     "XTwitterCommand",
+    "XUnfurlCommand",
     ]
 
 LOGGER = logging.getLogger(__name__)
 
+class SiteMatcher:
+    """
+    All the needles of the web commands, as one regex, so every message is
+    scanned once, however many sites there are.
+    Matching is only attempted where one of the hints of the sites starts,
+    and messages without any hint are not scanned at all.
+    """
+
+    def __init__(self):
+        self.sites = dict()
+        self.compiled = None
+
+    def register(self, site):
+        # One per class, a new registry replaces the commands of an old one
+        self.sites[type(site)] = site
+        self.compiled = None
+
+    def compile(self):
+        parts = list()
+        index = dict()
+        hints = set()
+        group = 1
+        for site in self.sites.values():
+            needle, _ = site.needle
+            parts += "({})".format(needle.pattern),
+            index[group] = site
+            group += needle.groups + 1
+            hints.add(site.hint)
+        if not parts:
+            self.compiled = None, None, index, ()
+            return self.compiled
+        hints = tuple(sorted(hints, key=len, reverse=True))
+        starts = re.compile("|".join(re.escape(h) for h in hints))
+        self.compiled = re.compile("|".join(parts)), starts, index, hints
+        return self.compiled
+
+    def scan(self, text):
+        """Yields (site, url) for every match in text"""
+        regex, starts, index, hints = self.compiled or self.compile()
+        if not regex or not any(h in text for h in hints):
+            return
+        pos = 0
+        while True:
+            start = starts.search(text, pos)
+            if not start:
+                return
+            match = regex.match(text, start.start())
+            if not match:
+                pos = start.start() + 1
+                continue
+            pos = max(match.end(), start.start() + 1)
+            # The enclosing group of the site closes last
+            base = match.lastindex
+            site = index[base]
+            yield site, match.group(base + site.needle[1])
+
+
+MATCHER = SiteMatcher()
+
+
 class WebCommand(Command):
+    """
+    A site to unfurl links of.
+    Not dispatched itself, XUnfurlCommand hands it the matches of its needle.
+    """
+
     needle = re.compile("^$"), 0
-    cooldown = LRUCache(maxsize=20)
-    timeout = 3 * 60
+    # Literal every match of the needle starts with
+    hint = "http"
+    # Host to limit concurrent fetches by, if not the one of the urls
+    host = None
 
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
@@ -58,41 +127,32 @@ class WebCommand(Command):
             self.needle = self.needle, 0
         if self.needle and isinstance(self.needle[0], str):
             self.needle = re.compile(self.needle[0]), self.needle[1]
-
-    def handles(self, cmd):
-        return bool(cmd)
+        MATCHER.register(self)
 
     @staticmethod
     def fixup(url):
         return url
 
-    def handle_cmd(self, cmd, remainder, msg):
-        needle, group = self.needle
-        now = time()
-        for url in needle.finditer(msg.msg):
-            url = url.group(group).strip()
-            if self.cooldown.get(url, 0) + self.timeout > now:
-                continue
-
-            self.cooldown[url] = now
-            try:
-                url = self.fixup(url)
-                if not url:
-                    continue
-                if self.onurl(url, msg) is False:
-                    break
-            except Exception:
-                LOGGER.exception("failed to process")
-        return False
-
-    def onurl(self, url, msg):
+    def onurl(self, url):
+        """
+        What to post about url, if anything, or False to skip the
+        other links of the message; runs on the unfurl pool.
+        The result is shared by all rooms asking at the same time.
+        """
         raise NotImplementedError()
 
     @staticmethod
-    def extract(url, *args):
-        args = [re.compile(a) if isinstance(a, str) else a for a in args]
-        text, _ = get_text(url)
-        return [text,] + [a.search(text) for a in args]
+    def render(info, msg):
+        """The text to post for what onurl came up with, for msg"""
+        return info
+
+    @staticmethod
+    def extract(url, *names, head_only=True, limit=None):
+        """
+        The meta tags names (property, name or itemprop) of url, as a Head.
+        Only reads as much of the page as it takes to find them.
+        """
+        return fetch_head(url, *names, head_only=head_only, limit=limit)
 
     @staticmethod
     def unescape(string):
@@ -110,73 +170,76 @@ class WebCommand(Command):
 class XYoutuberCommand(WebCommand):
     needle = r"https?://(?:www\.)?(?:youtu\.be/\S+|youtube\.com/(?:v|watch|embed)\S+)"
 
-    description = re.compile(r'itemprop="description"\s+content="(.+?)"', re.M | re.S)
-    duration = re.compile(r'itemprop="duration"\s+content="(.+?)"', re.M | re.S)
-    title = re.compile(r'itemprop="name"\s+content="(.+?)"', re.M | re.S)
+    # The tags are only given in the body, deep into large watch pages
+    limit = 4 << 20
 
-    def onurl(self, url, msg):
-        _, title, duration, desc = self.extract(url, self.title, self.duration, self.description)
-        title = self.unescape(title.group(1))
+    def onurl(self, url):
+        head = self.extract(
+            url, "itemprop:name", "itemprop:duration", "itemprop:description",
+            head_only=False, limit=self.limit)
+        title = self.unescape(head.first("itemprop:name"))
         if not title:
             return
+        duration = head.first("itemprop:duration")
         if duration:
-            duration = str(isodate.parse_duration(duration.group(1)))
-        desc = self.unescape(desc.group(1))
+            duration = str(isodate.parse_duration(duration))
+        desc = self.unescape(head.first("itemprop:description"))
         desc = None
+        return title, duration, desc
+
+    @staticmethod
+    def render(info, msg):
+        title, duration, desc = info
         if "mmortal" in msg.nick.lower():
             title += " (probably some shit music only a retard would like)"
 
         if duration and desc and msg.nick.lower() not in ("dongmaster", "doc"):
-            self.post("YouTube: {} ({})\n{}", title, duration, desc)
+            return "YouTube: {} ({})\n{}".format(title, duration, desc)
         elif duration:
-            self.post("YouTube: {} ({})", title, duration)
+            return "YouTube: {} ({})".format(title, duration)
         elif desc:
-            self.post("YouTube: {}\n{}", title, desc)
+            return "YouTube: {}\n{}".format(title, desc)
         else:
-            self.post("YouTube: {}", title)
+            return "YouTube: {}".format(title)
 
 
 class XLiveleakCommand(WebCommand):
-    needle = r"http://(?:.+?\.)?liveleak\.com/view\?[\S]+"
+    needle = r"http://(?:\S+?\.)?liveleak\.com/view\?[\S]+"
 
-    description = re.compile(r'property="og:description"\s+content="(.+?)"', re.M | re.S)
-    title = re.compile(r'property="og:title"\s+content="(.+?)"', re.M | re.S)
-
-    def onurl(self, url, msg):
-        _, title, desc = self.extract(url, self.title, self.description)
-        title = self.unescape(title.group(1))
+    def onurl(self, url):
+        head = self.extract(url, "og:title", "og:description")
+        title = self.unescape(head.first("og:title"))
         if not title:
             return
-        desc = self.unescape(desc.group(1))
+        desc = self.unescape(head.first("og:description"))
 
         if desc:
-            self.post("{}\n{}", title, desc)
+            return "{}\n{}".format(title, desc)
         else:
-            self.post("{}", title)
+            return title
 
 class XVimeoCommand(WebCommand):
     needle = r"https?://vimeo.com/\d+"
 
-    description = re.compile(r'property="og:description"\s+content="(.+?)"', re.M | re.S)
-    title = re.compile(r'property="og:title"\s+content="(.+?)"', re.M | re.S)
-
-    def onurl(self, url, msg):
-        _, title, desc = self.extract(url, self.title, self.description)
-        title = self.unescape(title.group(1))
+    def onurl(self, url):
+        head = self.extract(url, "og:title", "og:description")
+        title = self.unescape(head.first("og:title"))
         if not title:
             return
-        desc = self.unescape(desc.group(1))
+        desc = self.unescape(head.first("og:description"))
 
         if desc:
-            self.post("Vimeo: {}\n{}", title, desc)
+            return "Vimeo: {}\n{}".format(title, desc)
         else:
-            self.post("Vimeo: {}", title)
+            return "Vimeo: {}".format(title)
 
 
 class XIMdbCommand(WebCommand):
     needle = r"imdb\.com/title/(tt\d+)", 1
+    hint = "imdb.com"
+    host = "www.omdbapi.com"
 
-    def onurl(self, url, msg):
+    def onurl(self, url):
         resp = get_json("http://www.omdbapi.com/?i={}&plot=short&r=json".format(url))
         LOGGER.debug("%s", resp)
         title = resp.get("Title")
@@ -199,15 +262,15 @@ class XIMdbCommand(WebCommand):
         runtime = resp.get("Runtime", "over 9000 mins")
         plot = resp.get("Plot")
         if not plot:
-            self.post("{}\n{}, {}, {}, {}", title, year, rating, rated, runtime)
+            return "{}\n{}, {}, {}, {}".format(title, year, rating, rated, runtime)
         else:
-            self.post("{}\n{}, {}, {}, {}\n{}", title, year, rating, rated, runtime, plot)
+            return "{}\n{}, {}, {}, {}\n{}".format(title, year, rating, rated, runtime, plot)
 
 
 class XRedditCommand(WebCommand):
-    needle = r"https?://(www.)?reddit.com/r/.+?/[\S]+"
+    needle = r"https?://(www.)?reddit.com/r/\S+?/[\S]+"
 
-    def onurl(self, url, msg):
+    def onurl(self, url):
         jurl = url + ".json"
         resp = get_json(jurl)
         data = resp[0].get("data").get("children")[0].get("data")
@@ -227,13 +290,13 @@ class XRedditCommand(WebCommand):
         else:
             info = "{title}\n{sub}, Score: {score}\n{target}".format(
                 title=title, target=target, sub=sub, score=score)
-        self.post("Plebbit: {}", info)
+        return "Plebbit: {}".format(info)
 
 
 class XGithubIssuesCommand(WebCommand):
-    needle = r"https://github.com/.*?/(?:issues|pull)/\d+"
+    needle = r"https://github.com/\S*?/(?:issues|pull)/\d+"
 
-    def onurl(self, url, msg):
+    def onurl(self, url):
         resp = get_json(
             url.replace("https://github.com/", "https://api.github.com/repos/").
             replace("/pull/", "/pulls/"))
@@ -241,30 +304,88 @@ class XGithubIssuesCommand(WebCommand):
         body = resp.get("body")
         if len(body) > 295 - len(base):
             body = body[0:295 - len(base)] + "…"
-        self.post("{}\n{}", base, body)
+        return "{}\n{}".format(base, body)
 
 
 class XTwitterCommand(WebCommand):
-    needle = r"https://twitter.com/(.*)/status/\d+"
-
-    images = re.compile(r'property="og:image"\s+content="(.*?)"', re.M | re.S)
-    title = re.compile(r'property="og:title"\s+content="(.*?)"', re.M | re.S)
-    desc = re.compile(r'property="og:description"\s+content="(.*?)"', re.M | re.S)
+    needle = r"https://twitter.com/(\S*?)/status/\d+"
 
-    def onurl(self, url, msg):
-        resp, desc, title = self.extract(url, self.desc, self.title)
-        desc = self.unescape(desc.group(1))[1:-1]
+    def onurl(self, url):
+        head = self.extract(url, "og:description", "og:title", "og:image")
+        desc = (self.unescape(head.first("og:description")) or "")[1:-1]
         if not desc:
             return
-        title = self.unescape(title.group(1))
+        title = self.unescape(head.first("og:title"))
         if not title:
             return
-        imgs = [html.unescape(i.group(1))
-                for i in self.images.finditer(resp)
-                if "profile_images" not in i.group(1)]
+        imgs = [i for i in head.get("og:image", ()) if "profile_images" not in i]
         imgs = " ".join(imgs)
         if imgs:
             info = "{title}:\n{desc}\n{imgs}".format(title=title, desc=desc, imgs=imgs)
         else:
             info = "{title}:\n{desc}".format(title=title, desc=desc)
-        self.post("{}", info)
+        return info
+
+
+class XUnfurlCommand(Command):
+    """Unfurls the links of all the web commands, in one pass over messages"""
+
+    # Where the first of the site commands used to be dispatched, ahead of
+    # XResponderCommand, which may consume the message
+    order = "XGithubIssuesCommand"
+
+    # Seconds a link is not unfurled again in a room
+    cooldown = 3 * 60
+    # Links remembered per room
+    remember = 1024
+
+    def handles(self, cmd):
+        return bool(cmd)
+
+    def handle_cmd(self, cmd, remainder, msg):
+        recent = self.local.get("recent")
+        if recent is None:
+            recent = self.local["recent"] = TTLCache(maxsize=self.remember, ttl=self.cooldown)
+        sites = list()
+        jobs = list()
+        for site, url in MATCHER.scan(msg.msg):
+            url = url.strip()
+            key = type(site).__name__, normalize_url(url)
+            if key in recent:
+                continue
+            recent[key] = True
+            try:
+                url = site.fixup(url)
+            except Exception:
+                LOGGER.exception("failed to process")
+                continue
+            if url:
+                sites += site,
+                jobs += (url, site.onurl, (), site.host, key),
+        if not jobs:
+            return False
+        # Posts once done, without holding up the room meanwhile
+        # pylint: disable=no-member
+        future = ARBITRATOR.run_coroutine(self.unfurl(sites, jobs, msg))
+        future.add_done_callback(self.unfurled)
+        return False
+
+    @staticmethod
+    def unfurled(future):
+        if not future.cancelled() and future.exception():
+            LOGGER.error("Failed to unfurl", exc_info=future.exception())
+
+    async def unfurl(self, sites, jobs, msg):
+        # Fetched concurrently, shared with other rooms, posted in order
+        sites = iter(sites)
+        stopped = set()
+        async for _, info in UNFURLER.ordered(jobs):
+            site = next(sites)
+            if site in stopped:
+                continue
+            # Sites may refuse the rest of the links of a message
+            if info is False:
+                stopped.add(site)
+            elif info:
+                self.post("{}", site.render(info, msg))
+        return False
@@ -0,0 +1,149 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from gzip import GzipFile
+from hashlib import sha256
+from tempfile import SpooledTemporaryFile
+from time import time
+
+
+__all__ = ["Export", "ExportCommand"]
+
+LOGGER = logging.getLogger(__name__)
+
+# Dumps are built and uploaded off the room lanes, one at a time, so the
+# bookkeeping in the room contexts needs no locking
+EXPORTS = ThreadPoolExecutor(1, thread_name_prefix="export")
+
+
+class Export:
+    """
+    Lines streamed into a spooled temporary file (\\r\\n separated), maybe
+    gzipped, and keyed by the sha256 of the uncompressed content.
+    """
+
+    # Bytes kept in memory before spilling to disk
+    spool = 1 << 20
+
+    def __init__(self, lines, compress=False):
+        self.file = SpooledTemporaryFile(self.spool)
+        out = GzipFile(fileobj=self.file, mode="wb", mtime=0) if compress else self.file
+        digest = sha256()
+        self.size = 0
+        sep = b""
+        for line in lines:
+            data = sep + line.encode("utf-8")
+            sep = b"\r\n"
+            digest.update(data)
+            out.write(data)
+            self.size += len(data)
+        if out is not self.file:
+            out.close()
+        self.digest = digest.hexdigest()
+        self.file.seek(0)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ExportCommand:
+    """
+    Mixin for commands uploading dumps: a dump is only rebuilt when
+    something changed since it was built, and only uploaded when no upload
+    of the same content is still around in the room.
+    """
+
+    compress = False
+    # Uploads take a while to show up in the room
+    grace = 60
+
+    def is_present(self, fid, uploaded):
+        return fid in self.room.filedict or uploaded + self.grace > time()
+
+    def export_lines(self, sql, *args):
+        """
+        Lines of the rows of sql, columns joined by |, streamed from
+        self.conn (of a DBCommand)
+        """
+        # Queued writes first, so the dump is current
+        self.db.flush()
+        for row in self.conn.execute(sql, args):
+            yield "|".join(str(col) for col in row)
+
+    def upload_export(self, name, lines, changed, done):
+        """
+        Dump lines (an iterable, consumed lazily) as name, which changed
+        last at changed, in the background, then call done with the fid,
+        if any. Returns the Future of the fid.
+        """
+        return EXPORTS.submit(partial(
+            copy_context().run, self._export, name, lines, changed, done))
+
+    def _export(self, name, lines, changed, done):
+        try:
+            fid = self.export(name, lines, changed)
+        except Exception:
+            LOGGER.exception("Failed to export %s", name)
+            raise
+        if fid:
+            done(fid)
+        return fid
+
+    def export(self, name, lines, changed):
+        """Returns the fid of the dump, uploading it only if need be"""
+        local = self.local
+        uploads = local.setdefault("exports", dict())
+        built = local.setdefault("built", dict())
+        digest, when = built.get(name, (None, 0))
+        fid, uploaded = uploads.get(digest, (None, 0))
+        if fid and when >= changed and self.is_present(fid, uploaded):
+            return fid
+
+        upload_as = "{}.gz".format(name) if self.compress else name
+        with Export(lines, self.compress) as export:
+            built[name] = export.digest, time()
+            fid, uploaded = uploads.get(export.digest, (None, 0))
+            if fid and self.is_present(fid, uploaded):
+                LOGGER.debug("Reusing %s for %s", fid, name)
+                return fid
+            if not self.active:
+                return fid
+            LOGGER.debug("Uploading %s (%d bytes)", upload_as, export.size)
+            fid = self.room.upload_file(export.file, upload_as=upload_as)
+        # Forget uploads that expired
+        for key, (other, when) in list(uploads.items()):
+            if not self.is_present(other, when):
+                del uploads[key]
+        uploads[export.digest] = fid, time()
+        return fid
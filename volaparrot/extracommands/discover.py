@@ -26,10 +26,11 @@ import logging
 
 from io import BytesIO
 from math import log10 as log
+from threading import Lock
 from time import time
 
-from .command import Command, PulseCommand
-from .db import DBCommand
+from ..commands.command import Command, PulseCommand
+from ..commands.db import DBCommand
 from ..roomstat import roomstat
 
 
@@ -48,6 +49,8 @@ class DiscoverCommand(DBCommand, Command, PulseCommand):
     interval = 180
     last_check = 0
     refresh_rooms = []
+    # The pulses of all rooms come due together, on different workers
+    lock = Lock()
 
     def __init__(self, *args, **kw):
         opts = kw.get("args")
@@ -63,9 +66,14 @@ class DiscoverCommand(DBCommand, Command, PulseCommand):
         if not self.allowed(msg):
             self.post("{}: No rooms for you", msg.nick)
             return True
-        if self.add_rooms_from_msg(msg):
-            self.post("{}: Added moar CP", msg.nick)
+        try:
+            added = self.add_rooms_from_msg(msg)
+        except Exception:
+            LOGGER.exception("Failed to add rooms")
+            self.post("{}: Failed to add that, see the log", msg.nick)
             return True
+        if added:
+            self.post("{}: Added moar CP", msg.nick)
         return True
 
     def handle_delroom(self, cmd, remainder, msg):
@@ -128,8 +136,11 @@ class DiscoverCommand(DBCommand, Command, PulseCommand):
         if msg.nick.lower() == "chen" or msg.nick.lower() == "fishy":
             return
 
-        if self.add_rooms_from_msg(msg):
-            DiscoverCommand.dirty = True
+        try:
+            if self.add_rooms_from_msg(msg):
+                DiscoverCommand.dirty = True
+        except Exception:
+            LOGGER.exception("Failed to add rooms")
 
     def get_rooms(self, limit=None):
         def keyfn(room):
@@ -204,14 +215,18 @@ class DiscoverCommand(DBCommand, Command, PulseCommand):
             return False
 
         LOGGER.info("Added Room %s (%s) with (%d/%d)", room, room_id, users, files)
-        if room != room_id:
-            self.conn.cursor().execute("DELETE FROM rooms WHERE room = ?", (room,))
-            room = room_id
-        self.conn.cursor().execute(
-            "INSERT OR IGNORE INTO rooms "
-            "(room, title, users, files, firstadded) "
-            "VALUES(?, ?, ?, ?, ?)",
-            (room, title, users, files, int(time() * 1000)))
+
+        def add(conn):
+            if room != room_id:
+                conn.execute("DELETE FROM rooms WHERE room = ?", (room,))
+            conn.execute(
+                "INSERT OR IGNORE INTO rooms "
+                "(room, title, users, files, firstadded) "
+                "VALUES(?, ?, ?, ?, ?)",
+                (room_id, title, users, files, int(time() * 1000)))
+
+        # Listings right after have to see it
+        self.db.transact(add).result()
         return True
 
     def del_room(self, msg):
@@ -227,55 +242,59 @@ class DiscoverCommand(DBCommand, Command, PulseCommand):
         if room.startswith("#"):
             room = room[1:]
 
-        self.conn.cursor().execute("DELETE FROM rooms WHERE "
-                                   "room = ?",
-                                   (room,))
+        try:
+            self.commit("DELETE FROM rooms WHERE room = ?", (room,))
+        except Exception:
+            LOGGER.exception("Failed to delete room %s", room)
+            self.post("{}: Failed to nuke that room, see the log", msg.nick)
+            return True
         self.post("{}: Nuked that room", msg.nick)
         return True
 
     def onpulse(self, current):
-        if DiscoverCommand.last_check + 120 > time():
-            return
-        DiscoverCommand.last_check = time()
+        with self.lock:
+            if DiscoverCommand.last_check + 120 > time():
+                return
+            DiscoverCommand.last_check = time()
 
         LOGGER.debug("refreshing")
         try:
-            if not self.refresh_rooms:
-                cur = self.conn.cursor()
-                self.refresh_rooms = cur.execute(
-                    "SELECT room FROM rooms WHERE alive <> 2 "
-                    "ORDER BY users DESC, files DESC").fetchall()
-            rooms = self.refresh_rooms[:5]
-            del self.refresh_rooms[:5]
+            with self.lock:
+                if not self.refresh_rooms:
+                    cur = self.conn.cursor()
+                    self.refresh_rooms = cur.execute(
+                        "SELECT room FROM rooms WHERE alive <> 2 "
+                        "ORDER BY users DESC, files DESC").fetchall()
+                rooms = self.refresh_rooms[:5]
+                del self.refresh_rooms[:5]
             for (room,) in rooms:
-                cur = self.conn.cursor()
                 try:
                     room_id, title, users, files, disabled = roomstat(room)
                     if disabled:
                         LOGGER.warning("Killing disabled room")
-                        cur.execute("DELETE FROM rooms WHERE room = ?", (room,))
+                        self.db.write("DELETE FROM rooms WHERE room = ?", (room,))
                     else:
                         if room != room_id:
-                            cur.execute("DELETE FROM rooms WHERE room = ?", (room,))
+                            self.db.write("DELETE FROM rooms WHERE room = ?", (room,))
                             room = room_id
-                            cur.execute(
+                            self.db.write(
                                 "INSERT OR IGNORE INTO rooms "
                                 "(room, title, users, files, firstadded) "
                                 "VALUES(?, ?, ?, ?, ?)",
                                 (room, title, users, files, int(time() * 1000)))
                         LOGGER.debug("Updated %s %s", room, title)
-                        cur.execute("UPDATE rooms set title = ?, users = ?, files = ?, "
-                                    "alive = 1 "
-                                    "WHERE room = ?",
-                                    (title, users, files, room))
+                        self.db.write("UPDATE rooms set title = ?, users = ?, files = ?, "
+                                      "alive = 1 "
+                                      "WHERE room = ?",
+                                      (title, users, files, room))
                 except Exception as ex:
                     code = 0
                     cause = (ex and ex.__cause__) or (ex and ex.__context__) or None
                     if cause and "404" in str(cause):
                         code = 2
-                    cur.execute("UPDATE rooms SET alive = ? "
-                                "WHERE room = ?",
-                                (code, room,))
+                    self.db.write("UPDATE rooms SET alive = ? "
+                                  "WHERE room = ?",
+                                  (code, room,))
                     LOGGER.exception("Failed to stat room, %d", code)
         except Exception:
             LOGGER.exception("Failed to refresh rooms")
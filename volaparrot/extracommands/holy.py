@@ -1,10 +1,8 @@
 import logging
-import random
-
-from sqlite3 import OperationalError
 
 from ..commands.command import Command
 from ..commands.db import DBCommand
+from ..storage import QuotePool
 from ..utils import get_json
 
 __all__ = "HolyCommand",
@@ -17,24 +15,21 @@ class HolyCommand(Command, DBCommand):
         super().__init__(*args, **kw)
 
     def setup(self):
-        cur = self.conn.cursor()
         try:
-            try:
-                cur.execute("CREATE TABLE quran (verse TEXT)")
+            self.db.write("CREATE TABLE IF NOT EXISTS quran (verse TEXT)").result()
+            count, = self.conn.execute("SELECT COUNT(*) FROM quran").fetchone()
+            if not count:
                 json = get_json(
                     "http://api.globalquran.com/complete/en.sahih?format=json")
                 json = [
                     ("{v[surah]}:{v[ayah]}: {v[verse]}".format(v=v),)
                     for v in json["quran"]["en.sahih"].values()]
                 LOGGER.info("Importing %d verses", len(json))
-                cur.executemany("INSERT INTO quran VALUES(?)", json)
-            except OperationalError:
-                pass
-            cur.execute("SELECT * FROM quran WHERE length(verse) < 300")
-            rows = [c[0] for c in cur]
-            random.shuffle(rows)
-            LOGGER.info("Loaded %d verses", len(rows))
-            return rows
+                self.db.executemany("INSERT INTO quran VALUES(?)", json).result()
+            verses = QuotePool(self.db, "quran", "verse", where="length(verse) < 300")
+            verses.refresh()
+            LOGGER.info("Loaded %d verses", len(verses))
+            return verses
         except:
             LOGGER.exception("failed to set up")
             raise
@@ -44,8 +39,8 @@ class HolyCommand(Command, DBCommand):
     def handle_cmd(self, cmd, remainder, msg):
         if not self.allowed(msg):
             return False
-        verse = self.verses.pop()
-        if not self.verses:
-            self.verses = self.setup()
+        verse = self.verses.draw()
+        if not verse:
+            return False
         self.post("{}, the Holy Book says {}", msg.nick, verse)
         return True
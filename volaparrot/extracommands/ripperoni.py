@@ -27,6 +27,7 @@ import tempfile
 import os
 import threading
 
+from contextvars import copy_context
 from functools import partial
 from collections import namedtuple
 
@@ -93,7 +94,8 @@ class RipperoniCommand(Command):
             self.post("Failed: {}", job.url)
             return
         self.post("Uploading: {}", job.name)
-        uploader = threading.Thread(target=partial(self.upload, job=job))
+        # Carry over the room context, the command instance is shared by all rooms
+        uploader = threading.Thread(target=partial(copy_context().run, self.upload, job=job))
         uploader.start()
 
 
@@ -24,12 +24,13 @@ THE SOFTWARE.
 import logging
 
 from collections import namedtuple
-from io import BytesIO
+from functools import partial
 from time import time
 from uuid import uuid4
 
 from path import Path
 
+from ..export import ExportCommand
 from ..utils import requests
 from ..commands.command import Command
 from ..commands.db import DBCommand
@@ -40,12 +41,9 @@ __all__ = ["UploadDownloadCommand"]
 LOGGER = logging.getLogger(__name__)
 
 
-class UploadDownloadCommand(DBCommand, Command):
+class UploadDownloadCommand(DBCommand, Command, ExportCommand):
     file = namedtuple("File", ["phrase", "id", "name", "locked", "owner"])
-    workingset = dict()
     changed = 0
-    uploaded = 0
-    upload = None
 
     @staticmethod
     def to_file(data):
@@ -73,34 +71,32 @@ class UploadDownloadCommand(DBCommand, Command):
         newid.parent.mkdir_p()
         with open(newid, "wb") as outp:
             outp.write(content.read() if hasattr(content, "read") else content.encode("utf-8"))
+
         try:
-            cur = self.conn.cursor()
-            cur.execute("INSERT OR REPLACE INTO files (phrase, id, name, locked, owner) "
-                        "VALUES(?, ?, ?, ?, ?)",
-                        (phrase, newid, name, locked, owner))
-            UploadDownloadCommand.changed = time()
-            LOGGER.debug("changed %d", self.changed)
+            self.commit(
+                "INSERT OR REPLACE INTO files (phrase, id, name, locked, owner) "
+                "VALUES(?, ?, ?, ?, ?)",
+                (phrase, newid, name, locked, owner))
         except Exception:
-            LOGGER.exception("Failed to add file")
             try:
-                if not newid:
-                    raise Exception("huh?")
                 newid.unlink()
             except Exception:
                 pass
+            raise
+        UploadDownloadCommand.changed = time()
+        LOGGER.debug("changed %d", self.changed)
+        return newid
 
     def unlock_file(self, phrase):
-        cur = self.conn.cursor()
-        cur.execute("UPDATE files SET locked = 0 WHERE phrase = ?",
+        self.commit("UPDATE files SET locked = 0 WHERE phrase = ?",
                     (phrase.casefold(),))
 
     def del_file(self, phrase):
         file = self.get_file(phrase)
         if not file:
             return
-        cur = self.conn.cursor()
-        cur.execute("DELETE FROM files WHERE phrase = ?",
-                    (file.phrase,))
+        self.commit("DELETE FROM files WHERE phrase = ?", (file.phrase,))
+        UploadDownloadCommand.changed = time()
         file = Path(file.id)
         if file and file.exists():
             try:
@@ -125,7 +121,9 @@ class UploadDownloadCommand(DBCommand, Command):
         LOGGER.debug("upload: %s", file)
         if not file:
             return False
-        fid = self.workingset.get(file.id, None)
+        # File ids only make sense in the room they were uploaded to
+        workingset = self.local.setdefault("workingset", dict())
+        fid = workingset.get(file.id, None)
         LOGGER.debug("upload: %s", fid)
         fileobj = None
         try:
@@ -137,7 +135,7 @@ class UploadDownloadCommand(DBCommand, Command):
             LOGGER.debug("upload: not present")
             with open(file.id, "rb") as filep:
                 fid = self.room.upload_file(filep, upload_as=file.name)
-            self.workingset[file.id] = fid
+            workingset[file.id] = fid
         self.post("{}: @{}", remainder or msg.nick, fid)
         return True
 
@@ -164,7 +162,13 @@ class UploadDownloadCommand(DBCommand, Command):
             return False
 
         LOGGER.info("download: inserting file %s", file)
-        self.set_file(phrase, file.name, requests.get(file.url, stream=True).raw, admin, msg.nick)
+        try:
+            self.set_file(
+                phrase, file.name, requests.get(file.url, stream=True).raw, admin, msg.nick)
+        except Exception:
+            LOGGER.exception("Failed to add file %s", phrase)
+            self.post("{}: Failed to store that file, see the log", msg.nick)
+            return True
 
         if existing:
             try:
@@ -180,34 +184,29 @@ class UploadDownloadCommand(DBCommand, Command):
         if not self.isadmin(msg):
             self.post("Go rape a MercWMouth, {}", msg.nick)
             return False
-        self.del_file(remainder)
+        try:
+            self.del_file(remainder)
+        except Exception:
+            LOGGER.exception("Failed to delete file %s", remainder)
+            self.post("{}: Failed to delete that file, see the log", msg.nick)
         return True
 
     def cmd_unlockfile(self, remainder, msg):
         if not self.isadmin(msg):
             self.post("Dongo cannot code, {}", msg.nick)
             return False
-        self.unlock_file(remainder)
+        try:
+            self.unlock_file(remainder)
+        except Exception:
+            LOGGER.exception("Failed to unlock file %s", remainder)
+            self.post("{}: Failed to unlock that file, see the log", msg.nick)
         return True
 
     def cmd_files(self, remainder, msg):
         if not self.allowed(msg):
             return False
-        valid = self.upload
-        if valid:
-            valid = {f.id: f for f in self.room.files}.get(valid)
-            valid = valid and not valid.expired
-        LOGGER.debug("valid %s %d", valid, self.uploaded)
-        if not self.upload or self.uploaded < self.changed:
-            cur = self.conn.cursor()
-            phrases = "\r\n".join("{}|{}".format(*row)
-                                  for row in cur.execute("SELECT phrase, name "
-                                                         "FROM files "
-                                                         "ORDER BY phrase"))
-            with BytesIO(bytes(phrases, "utf-8")) as upload:
-                if self.active:
-                    self.upload = self.room.upload_file(upload,
-                                                        upload_as="files.txt")
-                self.uploaded = time()
-        self.post("{}: @{}", remainder or msg.nick, self.upload)
+        lines = self.export_lines("SELECT phrase, name FROM files ORDER BY phrase")
+        self.upload_export(
+            "files.txt", lines, self.changed,
+            partial(self.post, "{}: @{}", remainder or msg.nick))
         return True
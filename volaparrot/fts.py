@@ -0,0 +1,123 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+import sqlite3
+
+
+__all__ = ["available", "create", "exists", "rebuild"]
+
+LOGGER = logging.getLogger(__name__)
+
+TRIGGERS = "ai", "ad", "au"
+
+
+def available():
+    """Whether this sqlite has FTS5"""
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _names(table):
+    return "{}_fts".format(table), "{}_ids".format(table)
+
+
+def exists(conn, table):
+    _, ids = _names(table)
+    return bool(conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (ids,)).fetchone())
+
+
+def _triggers(conn, table):
+    fts, _ = _names(table)
+    return conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (?, ?, ?)",
+        tuple("{}_{}".format(fts, t) for t in TRIGGERS)).fetchall()
+
+
+def _drop(conn, table):
+    fts, ids = _names(table)
+    for name, kind in conn.execute(
+            "SELECT name, type FROM sqlite_master "
+            "WHERE name IN (?, ?) OR (type = 'trigger' AND name LIKE ?)",
+            (fts, ids, "{}_%".format(fts))).fetchall():
+        conn.execute("DROP {} {}".format(kind.upper(), name))
+
+
+def create(conn, table, columns):
+    """
+    Index the columns of table, keyed on its phrase, in a contentless FTS5
+    table {table}_fts, maintained by triggers.
+    Implicit rowids change on VACUUM, so the index rows are keyed on the
+    declared integer keys of {table}_ids instead.
+    The deletes rely on recursive_triggers for the implicit deletes of
+    INSERT OR REPLACE. A new index is built once from what is there already.
+    """
+    if exists(conn, table) and len(_triggers(conn, table)) == len(TRIGGERS):
+        return
+    # Whatever is there is an index of an older layout, or one that lost
+    # its triggers to an import that never finished
+    _drop(conn, table)
+    fts, ids = _names(table)
+    cols = ", ".join(columns)
+    new = ", ".join("new.{}".format(c) for c in columns)
+    old = ", ".join("old.{}".format(c) for c in columns)
+    insert = (
+        "INSERT OR IGNORE INTO {ids} (phrase) VALUES (new.phrase); "
+        "INSERT INTO {fts} (rowid, {cols}) "
+        "SELECT id, {new} FROM {ids} WHERE phrase = new.phrase; ")
+    delete = (
+        "INSERT INTO {fts} ({fts}, rowid, {cols}) "
+        "SELECT 'delete', id, {old} FROM {ids} WHERE phrase = old.phrase; "
+        "DELETE FROM {ids} WHERE phrase = old.phrase; ")
+    fmt = dict(table=table, fts=fts, ids=ids, cols=cols, new=new, old=old)
+    conn.execute("CREATE TABLE {ids} ("
+                 "id INTEGER PRIMARY KEY, phrase TEXT UNIQUE NOT NULL)".format(**fmt))
+    conn.execute("CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='')".format(**fmt))
+    conn.execute(("CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN " +
+                  insert + "END").format(**fmt))
+    conn.execute(("CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN " +
+                  delete + "END").format(**fmt))
+    conn.execute(("CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN " +
+                  delete + insert + "END").format(**fmt))
+    LOGGER.info("Building %s search index", table)
+    rebuild(conn, table)
+
+
+def rebuild(conn, table):
+    """Index everything in table from scratch, as if the triggers saw all of it"""
+    fts, ids = _names(table)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info({})".format(fts))]
+    fmt = dict(table=table, fts=fts, ids=ids, cols=", ".join(columns),
+               vals=", ".join("t.{}".format(c) for c in columns))
+    conn.execute("INSERT INTO {fts} ({fts}) VALUES ('delete-all')".format(**fmt))
+    conn.execute("DELETE FROM {ids} WHERE phrase NOT IN "
+                 "(SELECT phrase FROM {table})".format(**fmt))
+    conn.execute("INSERT OR IGNORE INTO {ids} (phrase) "
+                 "SELECT phrase FROM {table}".format(**fmt))
+    conn.execute("INSERT INTO {fts} (rowid, {cols}) "
+                 "SELECT i.id, {vals} FROM {table} AS t "
+                 "JOIN {ids} AS i ON i.phrase = t.phrase".format(**fmt))
@@ -0,0 +1,109 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from collections import Counter
+from threading import Lock
+
+
+__all__ = ["TrigramIndex", "distance"]
+
+
+def trigrams(word):
+    word = "  {} ".format(word)
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def distance(first, second, limit=None):
+    """Levenshtein distance, or limit + 1 once it is known to exceed limit"""
+    if len(first) < len(second):
+        first, second = second, first
+    if limit is not None and len(first) - len(second) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        current = [i]
+        for j, other in enumerate(second, 1):
+            current += min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char != other)),
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """
+    Approximate matching of short keys: candidates sharing the most
+    trigrams with the word are ranked by edit distance.
+    Best effort: with huge posting lists, only the rarer trigrams count.
+    """
+
+    candidates = 32
+    # Roughly how many postings a lookup may look at
+    budget = 5000
+
+    def __init__(self, words=()):
+        self.lock = Lock()
+        self.index = dict()
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        with self.lock:
+            for gram in trigrams(word):
+                self.index.setdefault(gram, set()).add(word)
+
+    def remove(self, word):
+        with self.lock:
+            for gram in trigrams(word):
+                words = self.index.get(gram)
+                if words:
+                    words.discard(word)
+                    if not words:
+                        del self.index[gram]
+
+    def suggest(self, word, num=3, maxdist=None):
+        """Up to num closest words, within maxdist (default: a third of word)"""
+        if maxdist is None:
+            maxdist = max(1, len(word) // 3)
+        shared = Counter()
+        with self.lock:
+            # Rare trigrams first; common ones say little and cost a lot
+            postings = sorted(
+                (self.index.get(gram, ()) for gram in trigrams(word)), key=len)
+            budget = self.budget
+            for words in postings:
+                if len(words) > budget and shared:
+                    break
+                shared.update(words)
+                budget -= len(words)
+        scored = list()
+        for cand, _ in shared.most_common(self.candidates):
+            if cand == word:
+                continue
+            dist = distance(word, cand, maxdist)
+            if dist <= maxdist:
+                scored += (dist, cand),
+        return [cand for _, cand in sorted(scored)[:num]]
@@ -22,30 +22,39 @@ THE SOFTWARE.
 """
 # pylint: disable=unused-wildcard-import,wildcard-import
 
+import asyncio
 import inspect
 import logging
 import os
+import re
 import sys
 
+from collections import defaultdict
+from concurrent.futures import Future
 from contextlib import suppress
+from functools import partial
 from importlib import import_module
-from time import time
-from sqlite3 import Connection
+from operator import itemgetter
+from time import monotonic, time
 
+from .arb import ARBITRATOR
 from .constants import *
 from .commands import *
+from .commands.db import MERCDB
+from .storage import Archive
+from .perf import LATENESS, PERF, name_of, timer
+from .workers import Lanes
 
 # Stuff cwd into python path
 sys.path += os.getcwd(),
 
-__all__ = ["Commands", "Handler"]
+__all__ = ["Commands", "Registry", "Handler"]
 
 LOGGER = logging.getLogger(__name__)
 
-MERCDB = Connection("merc.db", isolation_level=None)
-MERCDB.cursor().execute("CREATE TABLE IF NOT EXISTS merc (ts INT PRIMARY KEY, msg TEXT)")
-MERCDB.cursor().execute("CREATE TABLE IF NOT EXISTS red (ts INT PRIMARY KEY, msg TEXT)")
+ARCHIVE = Archive(MERCDB, ("merc", "red"))
 
+INLINE_FLAGS = (re.I, "i"), (re.M, "m"), (re.S, "s"), (re.X, "x")
 
 class Commands(list):
     def __init__(self, additional):
@@ -74,14 +83,13 @@ class Commands(list):
         return True
 
 
-class Handler:
-    def __init__(self, command_candidates, room, args):
-        self.room = room
-        self.blackfags = args.blacks
-        self.obamafags = args.obamas
-
-        self.obamas = dict()
+class Registry:
+    """
+    The process-wide command instances, shared by the handlers of all rooms.
+    Per-room state lives in the RoomContext of each handler.
+    """
 
+    def __init__(self, command_candidates, args):
         commands = list()
         file_commands = list()
         pulse_commands = list()
@@ -89,7 +97,7 @@ class Handler:
             if args.noparrot and issubclass(cand, PhraseCommand):
                 continue
             try:
-                inst = cand(room, args=args)
+                inst = cand(args=args)
                 if issubclass(cand, Command):
                     commands += inst,
                 if issubclass(cand, FileCommand):
@@ -100,11 +108,13 @@ class Handler:
                 LOGGER.exception("Failed to initialize commands %s", str(cand))
 
         def sort(cls):
-            return cls.__class__.__name__
+            return cls.order or cls.__class__.__name__
 
         self.commands = sorted(commands, key=sort)
         self.file_commands = sorted(file_commands, key=sort)
         self.pulse_commands = sorted(pulse_commands, key=sort)
+        self.dispatch, self.catchalls, self.patterns = self.index(self.commands)
+        self.names, self.methods, self.pattern = self.declared(self.commands)
         LOGGER.debug(
             "Initialized commands %s",
             ", ".join(repr(h) for h in self.commands))
@@ -115,18 +125,111 @@ class Handler:
             "Initialized pulse commands %s",
             ", ".join(repr(h) for h in self.pulse_commands))
 
+    @staticmethod
+    def index(commands):
+        """
+        Bucket commands by the handlers they declare, so chat does not have
+        to ask every single command about every single message.
+        Catch-alls (anything overriding handles) are merged into every
+        bucket at their original position, so dispatch order is unchanged.
+        """
+        exact = defaultdict(dict)
+        catchalls = list()
+        patterns = list()
+        for pos, command in enumerate(commands):
+            if type(command).handles is not BaseCommand.handles:
+                catchalls += (pos, command),
+                continue
+            # pylint: disable=protected-access
+            for handler in command._handlers:
+                exact[handler][pos] = command
+            if command.pattern:
+                patterns += (pos, command),
+        dispatch = dict()
+        for handler, bucket in exact.items():
+            bucket = list(bucket.items()) + catchalls
+            dispatch[handler] = tuple(sorted(bucket, key=itemgetter(0)))
+        return dispatch, tuple(catchalls), tuple(patterns)
+
+    @staticmethod
+    def declared(commands):
+        """
+        Handlers declared by any command, catch-alls included, the
+        handle_ methods they have, which may handle commands all the same,
+        and all their patterns in one (or None).
+        """
+        names = set()
+        methods = set()
+        patterns = list()
+        for command in commands:
+            # pylint: disable=protected-access
+            names.update(command._handlers)
+            methods.update(m for m in dir(type(command))
+                           if m.startswith("handle_") and m != "handle_cmd")
+            if command.pattern:
+                # Each keeps its own flags within the alternation
+                flags = "".join(f for flag, f in INLINE_FLAGS
+                                if command.pattern.flags & flag)
+                patterns += "(?{}:{})".format(flags, command.pattern.pattern),
+        pattern = re.compile("|".join(patterns)) if patterns else None
+        return frozenset(names), frozenset(methods), pattern
+
+    def known(self, cmd):
+        """Whether some command declared it handles cmd"""
+        if cmd in self.names or "handle_{}".format(cmd[1:]) in self.methods:
+            return True
+        return bool(self.pattern and self.pattern.match(cmd))
+
+    def candidates(self, cmd):
+        candidates = self.dispatch.get(cmd, self.catchalls)
+        matched = [p for p in self.patterns if p[1].pattern.match(cmd)]
+        if matched:
+            candidates = sorted(set(candidates).union(matched), key=itemgetter(0))
+        return candidates
+
+
+class Handler:
+    # Shared by all rooms; main() swaps in a pool according to the config
+    lanes = Lanes()
+
+    def __init__(self, registry, room, args):
+        self.registry = registry
+        self.room = room
+        self.context = RoomContext(room, args, registry)
+        self.blackfags = args.blacks
+        self.obamafags = args.obamas
+
+        self.obamas = dict()
+
+        self.commands = registry.commands
+        self.file_commands = registry.file_commands
+        self.pulse_commands = registry.pulse_commands
+
+    def candidates(self, cmd):
+        return self.registry.candidates(cmd)
+
     @staticmethod
     def maybe_log(msg, lnick):
         if (lnick == "mercwmouth" and msg.admin) or (lnick == "deadpool" and msg.logged_in):
-            MERCDB.cursor().execute(
-                "INSERT OR IGNORE INTO merc VALUES (?, ?)",
-                (int(time() * 10), msg.msg))
+            ARCHIVE.append("merc", msg.msg)
         elif lnick == "red" and msg.admin:
-            MERCDB.cursor().execute(
-                "INSERT OR IGNORE INTO red VALUES (?, ?)",
-                (int(time() * 10), msg.msg))
+            ARCHIVE.append("red", msg.msg)
 
     def chat(self, msg):
+        self.lanes.submit(self.room, self.on_chat, msg)
+
+    def file(self, file):
+        # Resolves post_fid waiters, never dropped
+        self.lanes.submit(self.room, self.on_file, file, shed=False)
+
+    def pulse(self, current):
+        self.lanes.submit(self.room, self.on_pulse, current)
+
+    def call(self, item):
+        # Timers and such, never dropped
+        self.lanes.submit(self.room, self.on_call, item, shed=False)
+
+    def on_chat(self, msg):
         if msg.nick == self.room.user.name or msg.nick in ("MOTD", "Reminder"):
             return
         LOGGER.info("%-23s: %s", self.room.name, msg)
@@ -148,54 +251,112 @@ class Handler:
                           cmd[1].strip() if len(cmd) == 2 else "")
         if not cmd:
             return
-        for command in self.commands:
+
+        def obama(res):
+            if is_obama and res:
+                self.obamas[lnick] = time()
+
+        res = self.run_chain("chat", self.chat_steps(cmd, remainder, msg), cmd)
+        if isinstance(res, Future):
+            res.add_done_callback(
+                lambda fut: obama(not fut.cancelled() and not fut.exception() and fut.result()))
+        else:
+            obama(res)
+        return res
+
+    def chat_steps(self, cmd, remainder, msg):
+        for _, command in self.candidates(cmd):
             try:
                 if not command.handles(cmd):
                     continue
-                method = "handle_{}".format(cmd[1:])
-                handler = getattr(command, method, None)
-                if handler:
-                    res = handler(cmd, remainder, msg)
-                else:
-                    res = command.handle_cmd(cmd, remainder, msg)
-                if res:
-                    if is_obama:
-                        self.obamas[lnick] = time()
-                    return
             except Exception:
                 LOGGER.exception(
                     "Failed to procss command %s with command %s",
                     cmd, repr(command))
+                continue
+            method = "handle_{}".format(cmd[1:])
+            handler = getattr(command, method, None) or command.handle_cmd
+            yield command, handler, (cmd, remainder, msg)
 
-    def file(self, file):
-        for command in self.file_commands:
-            try:
-                if command.onfile(file):
-                    return
-            except Exception:
-                LOGGER.exception(
-                    "Failed to procss command %s with command %s",
-                    file, repr(command))
+    def on_file(self, file):
+        waiting = self.context.waiters.arrived(file.id)
+        if waiting:
+            self.run_chain(
+                "file", ((getattr(w, "func", w), w, ()) for w in waiting), file.id, first=False)
+        return self.run_chain(
+            "file",
+            ((command, command.onfile, (file,)) for command in self.file_commands),
+            file)
 
-    def pulse(self, current):
+    def on_pulse(self, item):
+        current, due = item
         LOGGER.debug("got a pulse: %d", current)
-        for command in self.pulse_commands:
+        # Every due command gets its pulse, whatever the others return
+        return self.run_chain("pulse", self.pulse_steps(current, due), current, first=False)
+
+    def pulse_steps(self, current, due):
+        for command, when in due:
+            late = monotonic() - when
+            LATENESS.record("pulse", name_of(command), self.room.name, late)
+            LOGGER.debug("pulsing %r %.3fs late", command, late)
+            yield command, command.onpulse, (current,)
+
+    def on_call(self, item):
+        callback, args, kwargs = item
+        return self.run_chain(
+            "call",
+            iter(((callback, partial(callback, *args, **kwargs), ()),)),
+            "callback")
+
+    def run_chain(self, kind, steps, what, first=True):
+        """
+        Run (command, function, args) steps until one of them handles
+        the event, by returning something truthy (or all of them, unless
+        first).
+        Functions may be coroutine functions (async def), in which case the
+        coroutine is run on the arbitrator loop and the rest of the chain
+        continues once it is done. The future of the whole chain is returned,
+        which keeps the room lane waiting, so ordering is kept.
+        Every step is accounted for in PERF.
+        """
+        return self.context.run(self._run_chain, kind, steps, what, first)
+
+    def _run_chain(self, kind, steps, what, first):
+        for command, func, args in steps:
+            start = timer()
             try:
-                if not command.check_interval(current, command.interval):
-                    continue
-                if command.onpulse(current):
-                    return
+                res = func(*args)
             except Exception:
+                PERF.record(kind, name_of(command), self.room.name, timer() - start, True)
                 LOGGER.exception(
                     "Failed to procss command %s with command %s",
-                    time, repr(command))
+                    what, repr(command))
+                continue
+            if asyncio.iscoroutine(res):
+                # pylint: disable=no-member
+                return ARBITRATOR.run_coroutine(
+                    self.resume_chain(res, start, kind, command, steps, what, first))
+            PERF.record(kind, name_of(command), self.room.name, timer() - start)
+            if res and first:
+                return res
+        return None
 
-    @staticmethod
-    def call(item):
-        callback, args, kwargs = item
+    async def resume_chain(self, coro, start, kind, command, steps, what, first):
+        # pylint: disable=too-many-arguments
+        error = False
         try:
-            callback(*args, **kwargs)
+            res = await coro
         except Exception:
+            error = True
             LOGGER.exception(
-                "Failed to process callback with %r (%r, **%r)",
-                callback, args, kwargs)
+                "Failed to procss command %s with command %s",
+                what, repr(command))
+            res = None
+        PERF.record(kind, name_of(command), self.room.name, timer() - start, error)
+        if res and first:
+            return res
+        res = await ARBITRATOR.loop.run_in_executor(
+            self.lanes.executor, self.run_chain, kind, steps, what, first)
+        if isinstance(res, Future):
+            res = await asyncio.wrap_future(res)
+        return res
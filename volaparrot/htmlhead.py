@@ -0,0 +1,206 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import codecs
+import logging
+
+from html.parser import HTMLParser
+from threading import Lock
+from time import time
+
+from cachetools import LRUCache
+
+from .httpcache import Entry
+from .utils import requests
+
+
+__all__ = ["Head", "HeadParser", "HeadFetcher", "FETCHER", "fetch_head"]
+
+LOGGER = logging.getLogger(__name__)
+
+# Where a page ends, as far as we care
+HEAD_ENDS = frozenset(("head", "body"))
+# Attributes naming meta tags, in order of preference
+META_ATTRS = "property", "name", "itemprop"
+
+
+class Head(dict):
+    """Contents of meta tags by their property/name/itemprop"""
+
+    def first(self, name, default=None):
+        values = self.get(name)
+        return values[0] if values else default
+
+
+class Done(Exception):
+    pass
+
+
+class HeadParser(HTMLParser):
+    """
+    Collects the content of the wanted meta tags as the page is fed.
+    Names may be qualified by the attribute giving them, e.g. itemprop:name
+    for <meta itemprop="name">, and <meta name="name"> does not count.
+    Raises Done once all of them were seen (repeated tags, such as several
+    og:image, directly following each other are still collected), or the
+    head ended, unless head_only is off.
+    """
+
+    def __init__(self, names, head_only=True):
+        super().__init__()
+        self.names = frozenset(n.casefold() for n in names)
+        self.head_only = head_only
+        self.head = Head()
+
+    @property
+    def complete(self):
+        return len(self.head) == len(self.names)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            content = attrs.get("content")
+            name = content is not None and self.wanted(attrs)
+            if name:
+                self.head.setdefault(name, list()).append(content)
+                return
+        if self.complete or (self.head_only and tag == "body"):
+            raise Done()
+
+    def wanted(self, attrs):
+        """The wanted name of a meta tag, qualified (itemprop:name) or not"""
+        for attr in META_ATTRS:
+            value = attrs.get(attr)
+            if not value:
+                continue
+            value = value.casefold()
+            qualified = "{}:{}".format(attr, value)
+            if qualified in self.names:
+                return qualified
+            if value in self.names:
+                return value
+        return None
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self.complete or (self.head_only and tag in HEAD_ENDS):
+            raise Done()
+
+
+class HeadFetcher:
+    """
+    Streams pages and parses them only as far as needed, instead of
+    downloading whole documents for a couple of meta tags.
+    Heads are kept like HTTPCache keeps texts: fresh for a TTL, then
+    revalidated with ETag/Last-Modified if the server gave any. Error
+    responses are not kept.
+    """
+
+    chunk = 16 << 10
+    # Never read more than that of a page
+    limit = 512 << 10
+    ttl = 600
+    maxsize = 512
+
+    def __init__(self, session, ttl=None, maxsize=None):
+        self.session = session
+        if ttl is not None:
+            self.ttl = ttl
+        if maxsize is not None:
+            self.maxsize = maxsize
+        self.lock = Lock()
+        self.entries = LRUCache(maxsize=self.maxsize)
+
+    def fetch(self, url, *names, head_only=True, limit=None, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        key = url, names, head_only
+        now = time()
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry and entry.fresh(ttl, now):
+            return entry.value
+
+        headers = entry.validators if entry else {}
+        with self.session.get(url, headers=headers, stream=True) as resp:
+            if entry and headers and resp.status_code == 304:
+                LOGGER.debug("Revalidated %s", url)
+                entry.revalidated(ttl, now)
+                return entry.value
+            head = self.parse(resp, names, head_only, limit or self.limit)
+        if resp.ok:
+            with self.lock:
+                self.entries[key] = Entry(resp, ttl, head, 0)
+        return head
+
+    def parse(self, resp, names, head_only, limit):
+        parser = HeadParser(names, head_only)
+        read = 0
+        # requests assumes latin-1 for text/* without a charset
+        encoding = resp.encoding
+        if "charset" not in resp.headers.get("Content-Type", "").lower():
+            encoding = "utf-8"
+        try:
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            for chunk in resp.iter_content(self.chunk):
+                read += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.complete:
+                    break
+                if read >= limit:
+                    LOGGER.debug("Gave up on %s after %d bytes", resp.url, read)
+                    break
+            else:
+                parser.feed(decoder.decode(b"", True))
+                parser.close()
+        except Done:
+            pass
+        LOGGER.debug("Read %d bytes of %s", read, resp.url)
+        return parser.head
+
+    def invalidate(self, url):
+        """Forget all heads of url"""
+        with self.lock:
+            keys = [k for k in self.entries if k[0] == url]
+            for key in keys:
+                del self.entries[key]
+        return bool(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+FETCHER = HeadFetcher(requests)
+
+
+def fetch_head(url, *names, head_only=True, limit=None, ttl=None):
+    """The contents of the meta tags names of url, as a Head"""
+    return FETCHER.fetch(url, *names, head_only=head_only, limit=limit, ttl=ttl)
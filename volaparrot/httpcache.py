@@ -0,0 +1,138 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+
+__all__ = ["Entry", "HTTPCache"]
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Entry:
+    """What became of a response (its text by default), with its validators"""
+
+    __slots__ = "value", "etag", "modified", "fetched", "expires", "size"
+
+    def __init__(self, resp, ttl, value=None, size=None):
+        self.value = resp.text if value is None else value
+        self.etag = resp.headers.get("ETag")
+        self.modified = resp.headers.get("Last-Modified")
+        self.fetched = time()
+        self.expires = self.fetched + ttl
+        if size is None:
+            size = len(resp.content)
+        self.size = size + len(resp.url)
+
+    def fresh(self, ttl, now):
+        return self.fetched + ttl > now and self.expires > now
+
+    def revalidated(self, ttl, now):
+        self.fetched = now
+        self.expires = now + ttl
+
+    @property
+    def validators(self):
+        headers = dict()
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+        return headers
+
+
+class HTTPCache:
+    """
+    Successful (2xx) response texts by URL, each fresh for a TTL, within a
+    total size in bytes (least recently used go first).
+    Stale entries are revalidated with ETag/Last-Modified when the server
+    gave any, so unchanged pages are not downloaded again.
+    """
+
+    ttl = 600
+    maxsize = 16 << 20
+
+    def __init__(self, session, ttl=None, maxsize=None):
+        self.session = session
+        if ttl is not None:
+            self.ttl = ttl
+        if maxsize is not None:
+            self.maxsize = maxsize
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, url, ttl=None):
+        """Returns (text, time fetched or last revalidated)"""
+        ttl = self.ttl if ttl is None else ttl
+        now = time()
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry:
+                self.entries.move_to_end(url)
+        if entry and entry.fresh(ttl, now):
+            return entry.value, entry.fetched
+
+        headers = entry.validators if entry else {}
+        resp = self.session.get(url, headers=headers)
+        if entry and headers and resp.status_code == 304:
+            LOGGER.debug("Revalidated %s", url)
+            entry.revalidated(ttl, now)
+            return entry.value, entry.fetched
+        entry = Entry(resp, ttl)
+        # Error pages, even 404s, are rarely what stays there
+        if 200 <= resp.status_code < 300:
+            self.put(url, entry)
+        return entry.value, entry.fetched
+
+    def put(self, url, entry):
+        with self.lock:
+            old = self.entries.pop(url, None)
+            if old:
+                self.size -= old.size
+            if entry.size > self.maxsize:
+                return
+            self.entries[url] = entry
+            self.size += entry.size
+            while self.size > self.maxsize:
+                _, old = self.entries.popitem(last=False)
+                self.size -= old.size
+
+    def invalidate(self, url):
+        with self.lock:
+            old = self.entries.pop(url, None)
+            if old:
+                self.size -= old.size
+        return bool(old)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
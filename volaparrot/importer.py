@@ -0,0 +1,266 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+import os
+import shutil
+
+from collections import namedtuple
+from gzip import GzipFile
+from io import TextIOWrapper
+from itertools import chain, islice
+from time import perf_counter
+from uuid import uuid4
+
+from path import Path
+
+from . import fts
+
+
+__all__ = ["POLICIES", "ImportResult", "open_lines", "import_phrases", "import_files", "main"]
+
+LOGGER = logging.getLogger(__name__)
+
+UPSERT = (
+    "INSERT INTO {table} ({columns}) VALUES ({values}) "
+    "ON CONFLICT (phrase) DO UPDATE SET {update} WHERE {table}.locked = 0")
+
+# What to do about phrases already there
+POLICIES = "keep-locked", "overwrite", "skip"
+
+# Imports of fewer rows than that, or than a fraction of the table, keep
+# the search index triggers; rebuilding the index costs more than they do
+REBUILD_MIN = 10000
+REBUILD_FRACTION = 0.1
+
+ImportResult = namedtuple("ImportResult", ["read", "imported", "skipped", "bad", "elapsed"])
+
+
+def _statement(table, columns, policy):
+    values = ", ".join("?" for _ in columns)
+    if policy == "overwrite":
+        sql = "INSERT OR REPLACE INTO {table} ({columns}) VALUES ({values})"
+    elif policy == "skip":
+        sql = "INSERT OR IGNORE INTO {table} ({columns}) VALUES ({values})"
+    elif policy == "keep-locked":
+        sql = UPSERT
+    else:
+        raise ValueError("Unknown policy {}".format(policy))
+    update = ", ".join("{0} = excluded.{0}".format(c) for c in columns if c != "phrase")
+    return sql.format(
+        table=table, columns=", ".join(columns), values=values, update=update)
+
+
+def open_lines(fileobj, compressed=False):
+    """Text lines of a binary file object, as written by the exports"""
+    if compressed:
+        fileobj = GzipFile(fileobj=fileobj, mode="rb")
+    for line in TextIOWrapper(fileobj, encoding="utf-8", errors="replace"):
+        yield line.rstrip("\r\n")
+
+
+def parse(lines, counts):
+    """phrase|rest lines to (phrase, rest); counts read and bad lines"""
+    for line in lines:
+        counts["read"] += 1
+        phrase, sep, rest = line.partition("|")
+        phrase = phrase.strip().casefold()
+        rest = rest.strip()
+        if not sep or not phrase or " " in phrase or not rest:
+            counts["bad"] += 1
+            continue
+        yield phrase, rest
+
+
+def _suspend_fts(conn, table):
+    """
+    Drop the triggers feeding {table}_fts, returning them for _restore_fts.
+    Way faster than running the triggers for every row of a large import.
+    """
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'trigger' AND tbl_name = ? AND name LIKE ?",
+        (table, "{}_fts_%".format(table))).fetchall()
+    for name, _ in triggers:
+        conn.execute("DROP TRIGGER {}".format(name))
+    return triggers
+
+
+def _restore_fts(conn, table, triggers):
+    """Rebuild the search index in one go and restore its triggers"""
+    fts.rebuild(conn, table)
+    for _, sql in triggers:
+        conn.execute(sql)
+
+
+def _import(db, table, columns, rows, policy, counts, progress, batch):
+    """
+    Every batch is a transaction of its own, so other writes are not held
+    up by the whole import; a failure leaves the batches before in.
+    """
+    # pylint: disable=too-many-arguments
+    sql = _statement(table, columns, policy)
+
+    def run(conn, chunk):
+        # Unlike total_changes, this does not count what triggers do
+        changed = conn.executemany(sql, chunk).rowcount
+        counts["imported"] += changed
+        counts["skipped"] += len(chunk) - changed
+
+    triggers = None
+    if fts.exists(db.reader, table):
+        size, = db.execute(
+            "SELECT COALESCE(MAX(rowid), 0) FROM {}".format(table)).fetchone()
+        threshold = max(REBUILD_MIN, int(size * REBUILD_FRACTION))
+        head = list(islice(rows, threshold))
+        if len(head) >= threshold:
+            triggers = db.transact(_suspend_fts, table).result()
+        rows = chain(head, rows)
+    try:
+        while True:
+            chunk = list(islice(rows, batch))
+            if not chunk:
+                break
+            db.transact(run, chunk).result()
+            if progress:
+                progress(ImportResult(elapsed=perf_counter() - counts["start"], **{
+                    k: v for k, v in counts.items() if k != "start"}))
+    finally:
+        # Also after failures, the index covers what made it in
+        if triggers:
+            db.transact(_restore_fts, table, triggers).result()
+
+
+def _result(counts):
+    return ImportResult(elapsed=perf_counter() - counts.pop("start"), **counts)
+
+
+def import_phrases(db, lines, policy="keep-locked", owner="System", locked=False,
+                   progress=None, batch=50000):
+    """
+    Import phrase|text lines into the phrases table of db, a transaction
+    per batch, reporting the running ImportResult to progress after every
+    batch.
+    Phrases triggers (the search index) see every row, but nothing in memory
+    does; commands have to reload.
+    """
+    # pylint: disable=too-many-arguments
+    counts = dict(read=0, imported=0, skipped=0, bad=0, start=perf_counter())
+    locked = 1 if locked else 0
+    rows = ((phrase, text, locked, owner) for phrase, text in parse(lines, counts))
+    _import(db, "phrases", ("phrase", "text", "locked", "owner"),
+            rows, policy, counts, progress, batch)
+    return _result(counts)
+
+
+def import_files(db, lines, policy="keep-locked", owner="System", locked=False,
+                 progress=None, batch=1000, downloads="downloads"):
+    """
+    Import phrase|path lines as file aliases, copying the files into
+    downloads like !download does. Only files that are going to be imported
+    are copied; files replaced by the import are removed afterwards, as are
+    the copies of batches that failed.
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    counts = dict(read=0, imported=0, skipped=0, bad=0, start=perf_counter())
+    existing = dict(
+        (phrase, (fid, flag))
+        for phrase, fid, flag in db.execute("SELECT phrase, id, locked FROM files"))
+    replaced = list()
+    copied = list()
+    downloads = Path(downloads)
+    downloads.mkdir_p()
+    locked = 1 if locked else 0
+
+    def rows():
+        for phrase, path in parse(lines, counts):
+            path = Path(path).expand()
+            old = existing.get(phrase)
+            if old and (policy == "skip" or (policy == "keep-locked" and old[1])):
+                counts["skipped"] += 1
+                continue
+            if not os.path.isfile(path):
+                LOGGER.warning("Not a file: %s", path)
+                counts["bad"] += 1
+                continue
+            newid = downloads / "{!s}.cuckload".format(uuid4())
+            shutil.copyfile(path, newid)
+            copied.append(newid)
+            if old:
+                replaced.append(old[0])
+            existing[phrase] = newid, locked
+            yield phrase, newid, path.name, locked, owner
+
+    try:
+        # Skips were decided above already
+        _import(db, "files", ("phrase", "id", "name", "locked", "owner"),
+                rows(), "overwrite", counts, progress, batch)
+    finally:
+        # Whatever is not in files (any longer) is of no use
+        kept = set(fid for fid, in db.execute("SELECT id FROM files"))
+        for fid in chain(replaced, copied):
+            if fid in kept:
+                continue
+            try:
+                Path(fid).unlink()
+            except Exception:
+                LOGGER.exception("Failed to delete %s", fid)
+    return _result(counts)
+
+
+def main(argv=None):
+    """python -m volaparrot --import ..."""
+    import argparse
+
+    from .commands.db import PHRASESDB
+
+    parser = argparse.ArgumentParser(
+        prog="python -m volaparrot --import",
+        description="Bulk import phrase|text (or with --files phrase|path) lines, "
+                    "as written by !phrases and !files. Stop the bot first, "
+                    "or use !import in chat, as a running bot will not see "
+                    "the new phrases until restarted.")
+    parser.add_argument("file", type=str, help="File to import, may be gzipped (.gz)")
+    parser.add_argument("--files", action="store_true",
+                        help="Import file aliases instead of phrases")
+    parser.add_argument("--policy", choices=POLICIES, default="keep-locked",
+                        help="What to do with phrases already there "
+                             "(keep-locked: overwrite unless locked)")
+    parser.add_argument("--owner", type=str, default="System",
+                        help="Owner of the imported phrases")
+    parser.add_argument("--lock", action="store_true",
+                        help="Lock the imported phrases")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    def progress(res):
+        LOGGER.info("%d read, %d imported, %d skipped, %d bad, %.1fs",
+                    *res)
+
+    func = import_files if args.files else import_phrases
+    with open(args.file, "rb") as inp:
+        res = func(PHRASESDB, open_lines(inp, args.file.endswith(".gz")),
+                   policy=args.policy, owner=args.owner, locked=args.lock,
+                   progress=progress)
+    LOGGER.info("Done: %d read, %d imported, %d skipped, %d bad, %.1fs", *res)
+    return 0
@@ -0,0 +1,108 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+
+from collections import deque
+
+from volapi.arbritrator import ARBITRATOR
+
+
+__all__ = ["Outbox", "MAX_MESSAGE"]
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_MESSAGE = 300
+
+
+class Outbox:
+    """
+    Outgoing chat of a room.
+    Posts of the same source (command) made within window seconds of each
+    other are merged into as few messages of at most MAX_MESSAGE characters
+    as possible, and messages are sent no faster than rate per second, so
+    bursts do not get the bot throttled. Replies of different commands stay
+    messages of their own. Priority posts go out before everything else.
+    All the queue handling happens on the arbitrator loop, so no locking.
+    """
+
+    # Seconds to wait for the room to have a nick before posting
+    retry = 0.5
+
+    def __init__(self, room, window=0.25, rate=2.0):
+        self.room = room
+        self.window = max(0.0, window)
+        self.delay = 1.0 / rate if rate > 0 else 0.0
+        self.queue = deque()
+        self.urgent = deque()
+        self.handle = None
+        self.last = 0
+
+    @property
+    def loop(self):
+        return ARBITRATOR.loop
+
+    def post(self, msg, priority=False, source=None):
+        self.loop.call_soon_threadsafe(self._enqueue, msg[:MAX_MESSAGE], priority, source)
+
+    def _enqueue(self, msg, priority, source):
+        (self.urgent if priority else self.queue).append((msg, source))
+        now = self.loop.time()
+        when = max(now if priority else now + self.window, self.last + self.delay)
+        if self.handle and self.handle.when() <= when:
+            return
+        if self.handle:
+            self.handle.cancel()
+        self.handle = self.loop.call_at(when, self._flush)
+
+    def _next(self):
+        return self.urgent.popleft() if self.urgent else self.queue.popleft()
+
+    def _peek(self):
+        return self.urgent[0] if self.urgent else self.queue[0]
+
+    def _flush(self):
+        self.handle = None
+        if not self.urgent and not self.queue:
+            return
+        if not self.room.user.nick:
+            # post_chat would wait for the nick, blocking the very loop
+            # that is going to set it
+            self.handle = self.loop.call_later(self.retry, self._flush)
+            return
+        msg, source = self._next()
+        while source is not None and (self.urgent or self.queue):
+            more, other = self._peek()
+            if other is not source or len(msg) + 1 + len(more) > MAX_MESSAGE:
+                break
+            msg = "{}\n{}".format(msg, self._next()[0])
+        self.last = self.loop.time()
+        try:
+            self.room.post_chat(msg)
+        except Exception:
+            LOGGER.exception("Failed to post to %r", self.room)
+        if self.urgent or self.queue:
+            self.handle = self.loop.call_at(self.last + self.delay, self._flush)
+
+    def __len__(self):
+        return len(self.urgent) + len(self.queue)
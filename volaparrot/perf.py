@@ -0,0 +1,141 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+
+from time import perf_counter
+
+
+__all__ = ["LATENESS", "PERF", "Perf", "Stat", "name_of", "timer"]
+
+LOGGER = logging.getLogger(__name__)
+
+# Bucket i holds latencies below 2**i microseconds, the last one everything else
+BUCKETS = 25
+
+timer = perf_counter
+
+
+def name_of(obj):
+    """Name to account a command or callback under"""
+    func = getattr(obj, "__func__", None)
+    owner = getattr(obj, "__self__", None)
+    if func and owner is not None:
+        return "{}.{}".format(type(owner).__name__, func.__name__)
+    if callable(obj) and hasattr(obj, "__qualname__"):
+        return obj.__qualname__
+    return type(obj).__name__
+
+
+class Stat:
+    """Call count, error count and a log2 latency histogram"""
+
+    __slots__ = "calls", "errors", "total", "max", "buckets"
+
+    def __init__(self):
+        self.calls = self.errors = 0
+        self.total = self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, elapsed, error=False):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[min(int(elapsed * 1000000).bit_length(), BUCKETS - 1)] += 1
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.calls if self.calls else 0.0
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the percentile, in seconds"""
+        want = self.calls * pct / 100
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= want:
+                return min(2 ** i / 1000000, self.max)
+        return self.max
+
+
+class Perf:
+    """
+    Collects Stats per (kind, command, room).
+    Updates are not locked; under contention a count may get lost,
+    which is fine for the purpose and keeps the hot path cheap.
+    """
+
+    def __init__(self):
+        self.stats = dict()
+        self.since = timer()
+
+    def record(self, kind, command, room, elapsed, error=False):
+        # pylint: disable=too-many-arguments
+        key = kind, command, room
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats.setdefault(key, Stat())
+        stat.add(elapsed, error)
+
+    def aggregate(self, room=None):
+        """Stats per (kind, command), optionally only for one room"""
+        result = dict()
+        for (kind, command, sroom), stat in list(self.stats.items()):
+            if room is not None and sroom != room:
+                continue
+            result.setdefault((kind, command), Stat()).merge(stat)
+        return result
+
+    def top(self, num=5, room=None, key=lambda stat: stat.total):
+        stats = self.aggregate(room)
+        return sorted(stats.items(), key=lambda i: key(i[1]), reverse=True)[:num]
+
+    def table(self):
+        lines = ["{:<6} {:<40} {:<16} {:>8} {:>6} {:>9} {:>9} {:>9}".format(
+            "kind", "command", "room", "calls", "errs", "mean ms", "p99 ms", "max ms")]
+        for (kind, command, room), stat in sorted(
+                list(self.stats.items()), key=lambda i: i[1].total, reverse=True):
+            lines += "{:<6} {:<40} {:<16} {:>8} {:>6} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                kind, command, str(room), stat.calls, stat.errors,
+                stat.mean * 1000, stat.percentile(99) * 1000, stat.max * 1000),
+        return "\n".join(lines)
+
+    def reset(self):
+        self.stats = dict()
+        self.since = timer()
+
+
+PERF = Perf()
+# How late pulses ran, apart from what the commands took
+LATENESS = Perf()
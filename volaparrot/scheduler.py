@@ -0,0 +1,85 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+
+from heapq import heapify, heappop, heappush
+from math import floor
+
+
+__all__ = ["PulseScheduler"]
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PulseScheduler:
+    """
+    Deadlines of the pulse commands of all rooms, kept in one heap.
+    Deadlines are fixed-rate: the next one is always the previous one plus
+    the interval, so they do not drift however late a pulse fires. Should a
+    command fall behind by whole intervals, the missed ones are skipped
+    rather than fired in a burst.
+    Times are monotonic (loop.time()).
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+
+    def add(self, room, commands, now):
+        # Everything is due right away, like it used to be on the first pulse
+        for command in commands:
+            heappush(self.heap, (now, self.seq, room, command))
+            self.seq += 1
+
+    def remove(self, room):
+        self.heap = [e for e in self.heap if e[2] is not room]
+        heapify(self.heap)
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    @property
+    def next_due(self):
+        return self.heap[0][0]
+
+    def pop_due(self, now):
+        """
+        Pop and reschedule everything due by now.
+        Returns [(room, [(command, due), ...]), ...]
+        """
+        rooms = dict()
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            when, seq, room, command = heappop(heap)
+            rooms.setdefault(room, []).append((command, when))
+            nextdue = when + command.interval
+            if nextdue <= now:
+                skipped = floor((now - when) / command.interval)
+                LOGGER.debug("%r skipped %d pulses in %r", command, skipped, room)
+                nextdue = when + (skipped + 1) * command.interval
+            heappush(heap, (nextdue, seq, room, command))
+        return list(rooms.items())
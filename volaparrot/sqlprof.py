@@ -0,0 +1,166 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+import re
+import sqlite3
+
+from functools import lru_cache
+
+from .perf import Perf, timer
+
+
+__all__ = ["SQLPERF", "ProfiledConnection", "ProfiledCursor", "normalize"]
+
+LOGGER = logging.getLogger(__name__)
+
+# Granularity of counting VM instructions by the progress handler
+STEP = 1000
+
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.I)
+SPACE = re.compile(r"\s+")
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+
+@lru_cache(maxsize=1024)
+def normalize(sql):
+    """Statement with literals replaced, to aggregate by"""
+    sql = STRINGS.sub("?", sql)
+    sql = NUMBERS.sub("?", sql)
+    sql = IN_LISTS.sub("IN (?, ...)", sql)
+    return SPACE.sub(" ", sql).strip()
+
+
+class SQLProfile(Perf):
+    """
+    Stats per (normalized statement, database), plus the VM instructions
+    they took (in STEP units), and a log of slow statements with their query
+    plans.
+    Time is the time execute took, which for queries is the time to the
+    first row.
+    """
+
+    # Seconds after which a statement is logged as slow
+    slow = 0.1
+    # Whether connections trace statements, to log them with parameters;
+    # that is a python call per statement, triggers included, so off by default
+    tracing = False
+
+    def __init__(self):
+        super().__init__()
+        self.steps = dict()
+
+    def record_query(self, conn, sql, params, elapsed, steps, error=False):
+        # pylint: disable=too-many-arguments
+        stmt = normalize(sql)
+        self.record("sql", stmt, conn.name, elapsed, error)
+        key = stmt, conn.name
+        self.steps[key] = self.steps.get(key, 0) + steps
+        if elapsed >= self.slow:
+            self.log_slow(conn, sql, params, elapsed)
+
+    def log_slow(self, conn, sql, params, elapsed):
+        plan = ""
+        if params is not None and sql.lstrip().upper().startswith(EXPLAINABLE):
+            try:
+                plan = "\n".join(
+                    "  " + row[-1] for row in sqlite3.Connection.execute(
+                        conn, "EXPLAIN QUERY PLAN {}".format(sql), params))
+            except Exception as ex:
+                plan = "  no plan: {}".format(ex)
+        LOGGER.warning(
+            "Slow statement on %s, %.1fms: %s\n%s",
+            conn.name, elapsed * 1000, conn.traced or sql, plan)
+
+    def steps_of(self, stmt, room=None):
+        return sum(v for (s, r), v in list(self.steps.items())
+                   if s == stmt and (room is None or r == room)) * STEP
+
+    def reset(self):
+        super().reset()
+        self.steps = dict()
+
+
+SQLPERF = SQLProfile()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        return self.connection.profiled(super().execute, sql, params)
+
+    def executemany(self, sql, seq):
+        return self.connection.profiled(super().executemany, sql, seq, many=True)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection accounting all statements run through it in SQLPERF.
+    The progress handler counts VM instructions; when SQLPERF.tracing, the
+    trace callback captures the statement as sqlite ran it (parameters
+    expanded) for the slow log.
+    """
+
+    def __init__(self, database, *args, **kw):
+        super().__init__(database, *args, **kw)
+        self.name = str(database)
+        self.steps = 0
+        self.traced = None
+        self.tracing = False
+        self.set_progress_handler(self.progress, STEP)
+
+    def progress(self):
+        self.steps += 1
+        return 0
+
+    def trace(self, sql):
+        # The first one, not what triggers run after it
+        if self.traced is None:
+            self.traced = sql
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def profiled(self, func, sql, params, many=False):
+        # pylint: disable=too-many-arguments
+        if self.tracing is not SQLPERF.tracing:
+            self.tracing = SQLPERF.tracing
+            self.set_trace_callback(self.trace if self.tracing else None)
+        self.steps = 0
+        self.traced = None
+        start = timer()
+        try:
+            res = func(sql, params)
+        except Exception:
+            SQLPERF.record_query(self, sql, None, timer() - start, self.steps, True)
+            raise
+        SQLPERF.record_query(
+            self, sql, None if many else params, timer() - start, self.steps)
+        return res
@@ -0,0 +1,331 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import atexit
+import logging
+import random
+import sqlite3
+
+from array import array
+from collections import deque
+from contextlib import suppress
+from concurrent.futures import Future
+from queue import Empty, Queue
+from threading import Event, Lock, Thread, local
+from time import time
+
+from .sqlprof import ProfiledConnection
+
+
+__all__ = ["Database", "Archive", "QuotePool"]
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Database:
+    """
+    A sqlite database in WAL mode, with a read connection per thread and a
+    single writer thread.
+    Writes are queued and the writer groups whatever is queued into one
+    transaction, so writers never block readers or the room lanes, and there
+    is one fsync per batch instead of one per statement.
+    All connections account their statements in sqlprof.SQLPERF.
+    """
+
+    # Prepared statements cached per connection
+    statements = 256
+    # Max statements per transaction
+    batch = 512
+    timeout = 30
+
+    def __init__(self, path, schema=()):
+        self.path = path
+        self.local = local()
+        self.queue = Queue()
+        self.writer = self.connect()
+        self.writer.execute("PRAGMA journal_mode = WAL")
+        for sql in schema:
+            self.writer.execute(sql)
+        self.thread = Thread(
+            target=self.write_loop, name="db-{}".format(path), daemon=True)
+        self.thread.start()
+        # Whatever is still queued gets committed on the way out
+        atexit.register(self.close)
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.statements,
+            factory=ProfiledConnection)
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA recursive_triggers = ON")
+        return conn
+
+    @property
+    def reader(self):
+        """The read connection of the current thread"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self.connect()
+        return conn
+
+    def execute(self, sql, params=()):
+        """Read; returns a cursor of the calling thread's connection"""
+        return self.reader.execute(sql, params)
+
+    def write(self, sql, params=()):
+        """Queue a write, returns a Future of its rowcount"""
+        return self._enqueue(lambda conn: conn.execute(sql, params).rowcount)
+
+    def executemany(self, sql, seq):
+        """Queue a bulk write, returns a Future of its rowcount"""
+        seq = list(seq)
+        return self._enqueue(lambda conn: conn.executemany(sql, seq).rowcount)
+
+    def transact(self, func, *args):
+        """
+        Queue func(conn, *args), run on the writer in a transaction.
+        Returns a Future of its result.
+        """
+        return self._enqueue(lambda conn: func(conn, *args))
+
+    def flush(self, timeout=None):
+        """Wait for everything queued so far to be committed"""
+        return self._enqueue(lambda conn: None).result(timeout)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _enqueue(self, job):
+        fut = Future()
+        if not self.thread.is_alive():
+            fut.set_exception(RuntimeError("{} is closed".format(self.path)))
+            return fut
+        self.queue.put((job, fut))
+        return fut
+
+    def _take(self):
+        item = self.queue.get()
+        if item is None:
+            return None, True
+        items = [item]
+        while len(items) < self.batch:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item is None:
+                return items, True
+            items += item,
+        return items, False
+
+    def write_loop(self):
+        conn = self.writer
+        done = False
+        while not done:
+            items, done = self._take()
+            if not items:
+                continue
+            results = list()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for job, fut in items:
+                    # A failing statement is only rolled back by itself
+                    conn.execute("SAVEPOINT job")
+                    try:
+                        results += (fut, job(conn), None),
+                        conn.execute("RELEASE job")
+                    except Exception as ex:
+                        conn.execute("ROLLBACK TO job")
+                        conn.execute("RELEASE job")
+                        LOGGER.warning("Failed to write to %s: %s", self.path, ex)
+                        results += (fut, None, ex),
+                conn.execute("COMMIT")
+            except Exception as ex:
+                LOGGER.exception("Failed to commit to %s", self.path)
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for _, fut in items:
+                    fut.set_exception(ex)
+                continue
+            for fut, res, ex in results:
+                if ex:
+                    fut.set_exception(ex)
+                else:
+                    fut.set_result(res)
+        conn.close()
+
+    def __repr__(self):
+        return "<Database({!r}, queued={})>".format(self.path, self.queue.qsize())
+
+
+class Archive:
+    """
+    Append-only logging of messages into (ts INT PRIMARY KEY, msg TEXT)
+    tables of a Database.
+    append only queues; a background thread flushes once size messages are
+    queued or every interval seconds. Keys are time() in 1/10s, bumped past
+    the last key of the table, so messages are never dropped for colliding.
+    """
+
+    size = 64
+    interval = 5.0
+
+    def __init__(self, db, tables):
+        self.db = db
+        self.last = dict()
+        for table in tables:
+            cur = db.execute("SELECT MAX(ts) FROM {}".format(table))
+            self.last[table] = cur.fetchone()[0] or 0
+        self.pending = deque()
+        self.wakeup = Event()
+        self.closed = False
+        self.thread = Thread(target=self.flush_loop, name="archive", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def append(self, table, msg):
+        if table not in self.last:
+            raise ValueError("Not archiving {}".format(table))
+        self.pending.append((table, time(), msg))
+        if len(self.pending) >= self.size:
+            self.wakeup.set()
+
+    def flush_loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                LOGGER.exception("Failed to flush archive")
+
+    def flush(self):
+        """Write what is queued; only ever called from one thread at a time"""
+        rows = dict()
+        while self.pending:
+            table, stamp, msg = self.pending.popleft()
+            key = self.last[table] = max(int(stamp * 10), self.last[table] + 1)
+            rows.setdefault(table, list()).append((key, msg))
+        if not rows:
+            return None
+
+        def write(conn):
+            for table, items in rows.items():
+                conn.executemany(
+                    "INSERT INTO {} (ts, msg) VALUES (?, ?)".format(table), items)
+
+        return self.db.transact(write)
+
+    def close(self):
+        """Stop flushing in the background and drain what is left"""
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        fut = self.flush()
+        if fut:
+            fut.result()
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class QuotePool:
+    """
+    Draws random values of a column of a table without scanning it: the
+    rowids of the (where-matching) rows are kept in an array, which picks up
+    appended rows incrementally.
+    Unless repeat, rows are drawn without repeats by shuffling the rowids
+    lazily (Fisher-Yates, one step per draw), starting over once all were
+    drawn.
+    """
+
+    def __init__(self, db, table, column, where=None, repeat=False):
+        # pylint: disable=too-many-arguments
+        self.db = db
+        self.repeat = repeat
+        where = " AND ({})".format(where) if where else ""
+        self.query_ids = "SELECT rowid FROM {} WHERE rowid > ?{} ORDER BY rowid".format(
+            table, where)
+        self.query_row = "SELECT {} FROM {} WHERE rowid = ?".format(column, table)
+        self.lock = Lock()
+        self.rowids = array("q")
+        self.last = 0
+        self.drawn = 0
+
+    def refresh(self):
+        with self.lock:
+            last = self.last
+        new = [rowid for (rowid,) in self.db.execute(self.query_ids, (last,))]
+        if not new:
+            return
+        with self.lock:
+            # Drawing shuffles rowids, so the last one is not the max
+            if self.last != last:
+                return
+            self.rowids.extend(new)
+            self.last = new[-1]
+
+    def pick(self):
+        with self.lock:
+            rowids = self.rowids
+            if not rowids:
+                return None
+            if self.repeat:
+                return rowids[random.randrange(len(rowids))]
+            if self.drawn >= len(rowids):
+                self.drawn = 0
+            drawn = self.drawn
+            other = random.randrange(drawn, len(rowids))
+            rowids[drawn], rowids[other] = rowids[other], rowids[drawn]
+            self.drawn += 1
+            return rowids[drawn]
+
+    def draw(self):
+        """A random value, or None if there are no rows"""
+        self.refresh()
+        for _ in range(5):
+            rowid = self.pick()
+            if rowid is None:
+                return None
+            row = self.db.execute(self.query_row, (rowid,)).fetchone()
+            if row:
+                return row[0]
+            # Deleted in the meantime
+            with self.lock:
+                with suppress(ValueError):
+                    pos = self.rowids.index(rowid)
+                    del self.rowids[pos]
+                    if pos < self.drawn:
+                        self.drawn -= 1
+        return None
+
+    def __len__(self):
+        return len(self.rowids)
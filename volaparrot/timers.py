@@ -0,0 +1,129 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+
+from threading import Lock
+from time import monotonic
+
+from .perf import name_of
+
+
+__all__ = ["Timer", "Timers"]
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Timer:
+    """Handle of a call_later, which may be cancelled until it fired"""
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, timers, room, delay, callback, args, kw, key=None):
+        self.timers = timers
+        self.room = room
+        self.when = monotonic() + delay
+        self.callback = callback
+        self.args = args
+        self.kw = kw
+        self.key = key
+        self.handle = None
+        self.cancelled = False
+        self.fired = False
+
+    @property
+    def pending(self):
+        return not self.cancelled and not self.fired
+
+    @property
+    def remaining(self):
+        return max(0.0, self.when - monotonic())
+
+    def cancel(self):
+        if not self.pending:
+            return False
+        self.cancelled = True
+        self.timers.done(self)
+        handle = self.handle
+        if handle:
+            self.timers.loop.call_soon_threadsafe(handle.cancel)
+        return True
+
+    def __repr__(self):
+        return "<Timer {} in {:.1f}s{}>".format(
+            name_of(self.callback), self.remaining,
+            " key={!r}".format(self.key) if self.key is not None else "")
+
+
+class Timers:
+    """
+    Bookkeeping of the outstanding timers of all rooms.
+    A room may only have limit timers outstanding; keyed timers with the
+    same callback and key are only scheduled once.
+    """
+
+    limit = 64
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.lock = Lock()
+        self.rooms = dict()
+        self.keys = dict()
+
+    def add(self, timer):
+        """Register timer, or return the already pending one for its key"""
+        with self.lock:
+            if timer.key is not None:
+                key = timer.room, timer.callback, timer.key
+                existing = self.keys.get(key)
+                if existing:
+                    LOGGER.debug("Not scheduling %r again", timer)
+                    return existing
+            pending = self.rooms.setdefault(timer.room, set())
+            if len(pending) >= self.limit:
+                LOGGER.warning(
+                    "%r has %d timers outstanding already, dropping %r",
+                    timer.room, len(pending), timer)
+                return None
+            pending.add(timer)
+            if timer.key is not None:
+                self.keys[key] = timer
+        return timer
+
+    def done(self, timer):
+        with self.lock:
+            pending = self.rooms.get(timer.room)
+            if pending:
+                pending.discard(timer)
+                if not pending:
+                    del self.rooms[timer.room]
+            if timer.key is not None:
+                key = timer.room, timer.callback, timer.key
+                if self.keys.get(key) is timer:
+                    del self.keys[key]
+
+    def pending(self, room=None):
+        with self.lock:
+            if room is not None:
+                return sorted(self.rooms.get(room, ()), key=lambda t: t.when)
+            return {r: sorted(p, key=lambda t: t.when) for r, p in self.rooms.items()}
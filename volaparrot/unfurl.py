@@ -0,0 +1,159 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .perf import PERF, timer
+
+
+__all__ = ["Unfurler", "UNFURLER", "normalize_url"]
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """
+    The same link, however it was written: case of scheme and host, default
+    ports, fragments and utm_ tracking parameters do not matter.
+    Anything that is not an absolute URL is returned as is.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.hostname:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = "{}:{}".format(netloc, port)
+    query = parts.query
+    if "utm_" in query:
+        query = urlencode([(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+                           if not k.startswith("utm_")])
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+class Unfurler:
+    """
+    Runs blocking fetches of URLs (onurl of web commands) on a thread pool,
+    at most limit at a time and at most per_host per host.
+    Lives on the arbitrator loop; semaphores are only touched from there.
+    Fetches given the same key while one is in flight share it and its
+    result (or failure), whichever rooms they are for.
+    """
+
+    limit = 16
+    per_host = 2
+
+    def __init__(self, limit=None, per_host=None):
+        if limit is not None:
+            self.limit = limit
+        if per_host is not None:
+            self.per_host = per_host
+        self.executor = ThreadPoolExecutor(self.limit, thread_name_prefix="unfurl")
+        self.inflight = None
+        self.hosts = dict()
+        self.flights = dict()
+
+    async def fetch(self, url, func, *args, host=None, key=None):
+        """
+        Await func(url, *args) on the pool, in the context of the caller
+        (of the first one, for shared flights)
+        """
+        if key is None:
+            return await self.run(url, func, args, host)
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(self.run(url, func, args, host))
+            self.flights[key] = flight
+            flight.add_done_callback(partial(self.landed, key))
+        else:
+            LOGGER.debug("Joined the flight of %s", url)
+            PERF.record("unfurl", "(joined)", None, 0)
+        # Waiters going away must not cancel the fetch for the others
+        return await asyncio.shield(flight)
+
+    def landed(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        # Nobody might be waiting anymore
+        if not flight.cancelled():
+            flight.exception()
+
+    async def run(self, url, func, args, host):
+        if self.inflight is None:
+            self.inflight = asyncio.Semaphore(self.limit)
+        host = host or urlsplit(url).hostname or url
+        sem, users = self.hosts.get(host, (None, 0))
+        if sem is None:
+            sem = asyncio.Semaphore(self.per_host)
+        self.hosts[host] = sem, users + 1
+        try:
+            async with sem, self.inflight:
+                start = timer()
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        self.executor, partial(copy_context().run, func, url, *args))
+                finally:
+                    PERF.record("unfurl", host, None, timer() - start)
+        finally:
+            sem, users = self.hosts[host]
+            if users <= 1:
+                del self.hosts[host]
+            else:
+                self.hosts[host] = sem, users - 1
+
+    async def ordered(self, jobs):
+        """
+        Run all (url, func, args, host, key) jobs concurrently, yielding
+        (url, result) in the order of jobs; failures are logged and yield None.
+        """
+        urls = list()
+        tasks = list()
+        for url, func, args, host, key in jobs:
+            urls += url,
+            tasks += asyncio.ensure_future(
+                self.fetch(url, func, *args, host=host, key=key)),
+        try:
+            for url, task in zip(urls, tasks):
+                try:
+                    yield url, await task
+                except Exception:
+                    LOGGER.exception("Failed to unfurl %s", url)
+                    yield url, None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+UNFURLER = Unfurler()
@@ -22,30 +22,57 @@ THE SOFTWARE.
 """
 # pylint: disable=invalid-name
 
-from functools import lru_cache, partial
-from time import time
+import json
+
+from functools import partial
 
 from requests import Session
+from requests.adapters import HTTPAdapter
+
+from .httpcache import HTTPCache
 
 
-__all__ = ["requests", "get_text", "get_json"]
+__all__ = ["requests", "cache", "get_text", "get_json"]
 
 UA = (
     "Mozilla/5.0 (Linux; cli) pyrequests/0.1 "
     "(python, like Gecko, like KHTML, like wget, like CURL) volaparrot/1.0")
-requests = Session()
+
+
+class TimeoutSession(Session):
+    """A Session whose requests time out unless told otherwise"""
+
+    # (connect, read) seconds
+    timeout = 3.05, 10
+
+    def __init__(self, pool=16):
+        super().__init__()
+        # Connections kept per host, enough for the unfurl workers
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kw):
+        # pylint: disable=arguments-differ
+        kw.setdefault("timeout", self.timeout)
+        return super().request(method, url, *args, **kw)
+
+
+requests = TimeoutSession()
 requests.headers.update({
     "User-Agent": UA,
     })
 
-@lru_cache(128)
-def get_text(url):
-    return requests.get(url).text, time()
+cache = HTTPCache(requests)
+
+
+def get_text(url, ttl=None):
+    """(text, time fetched) of url, from the cache if fresh enough"""
+    return cache.get(url, ttl)
 
 
-@lru_cache(512)
-def get_json(url):
-    return requests.get(url).json()
+def get_json(url, ttl=None):
+    return json.loads(get_text(url, ttl)[0])
 
 def u8str(s):
     return str(s, encoding="utf-8", errors="ignore")
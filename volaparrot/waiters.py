@@ -0,0 +1,76 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+
+from threading import Lock
+
+
+__all__ = ["FileWaiters"]
+
+LOGGER = logging.getLogger(__name__)
+
+
+class FileWaiters:
+    """
+    Callbacks of a room waiting for a file to show up, fed by the file
+    events the handler receives anyway.
+    Each callback may come with a timeout Timer, which is cancelled once the
+    callback is done waiting.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.waiting = dict()
+
+    def wait(self, fid, callback, timer=None):
+        with self.lock:
+            self.waiting.setdefault(fid, dict())[callback] = timer
+
+    def arrived(self, fid):
+        """Pops and returns the callbacks waiting for fid"""
+        with self.lock:
+            callbacks = self.waiting.pop(fid, None)
+        if not callbacks:
+            return ()
+        for timer in callbacks.values():
+            if timer:
+                timer.cancel()
+        return list(callbacks)
+
+    def expire(self, fid, callback):
+        """Stop waiting, returns whether the callback was still waiting"""
+        with self.lock:
+            callbacks = self.waiting.get(fid)
+            if not callbacks or callback not in callbacks:
+                return False
+            timer = callbacks.pop(callback)
+            if not callbacks:
+                del self.waiting[fid]
+        if timer:
+            timer.cancel()
+        return True
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(c) for c in self.waiting.values())
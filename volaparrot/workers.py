@@ -0,0 +1,114 @@
+"""
+The MIT License (MIT)
+Copyright © 2017 RealDolos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+
+__all__ = ["Lanes"]
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Lanes:
+    """
+    Runs work on a shared thread pool, in one lane per key (room).
+    Work within a lane runs strictly in order, different lanes run in
+    parallel. Work may return a Future (e.g. of an async command), in which
+    case its lane waits for the future before running anything else.
+    Each lane holds at most depth pending sheddable items (chat, pulses);
+    anything beyond that is dropped instead of stalling the listener thread.
+    With no workers, everything simply runs inline on the calling thread,
+    which then also waits for any returned future.
+    """
+
+    batch = 16
+
+    def __init__(self, workers=0, depth=100):
+        self.workers = max(0, workers)
+        self.depth = max(1, depth)
+        self.lock = Lock()
+        self.lanes = dict()
+        self.executor = None
+        if self.workers:
+            self.executor = ThreadPoolExecutor(self.workers)
+
+    def submit(self, key, func, *args, shed=True):
+        """
+        Queue func(*args) in the lane of key. Unless shed is off (for
+        events that must not get lost), nothing is queued when the lane is
+        full already.
+        """
+        if not self.executor:
+            try:
+                res = func(*args)
+                # Nothing else may run before it, just like in a lane
+                if isinstance(res, Future):
+                    res.result()
+            except Exception:
+                LOGGER.exception("Failed to run %r", func)
+            return True
+
+        with self.lock:
+            lane = self.lanes.get(key)
+            start = lane is None
+            if start:
+                lane = self.lanes[key] = deque()
+            elif shed and len(lane) >= self.depth:
+                LOGGER.warning("Lane for %r is full, dropping %r", key, func)
+                return False
+            lane.append((func, args))
+        if start:
+            self.executor.submit(self._drain, key)
+        return True
+
+    def _drain(self, key):
+        # Only run a batch at a time, then requeue, so that one busy lane
+        # cannot hog a worker while other lanes are waiting for one.
+        for _ in range(self.batch):
+            with self.lock:
+                lane = self.lanes[key]
+                if not lane:
+                    del self.lanes[key]
+                    return
+                func, args = lane.popleft()
+            try:
+                res = func(*args)
+            except Exception:
+                LOGGER.exception("Failed to run %r", func)
+                continue
+            if isinstance(res, Future):
+                res.add_done_callback(lambda _: self.executor.submit(self._drain, key))
+                return
+        self.executor.submit(self._drain, key)
+
+    def pending(self, key):
+        with self.lock:
+            return len(self.lanes.get(key, ()))
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)